@@ -0,0 +1,479 @@
+"""Offline benchmark for the SharePoint -> Lakehouse transfer.
+
+Drives SharePointToLakehouseOrchestrator end to end against a local stand-in for
+Microsoft Graph and the OneLake DFS endpoint, with `mssparkutils.fs` replaced by a
+filesystem-backed shim. No tenant, App Registration or Fabric session is needed, so
+throughput and latency can be compared before a change is deployed.
+
+Requires the same packages as the main script (msal, requests, pandas, pytz).
+
+    python benchmark_sharepoint_ingest.py --files 2000 --size-kb 64 --latency-ms 30 --workers 1,8,16
+    python benchmark_sharepoint_ingest.py --files 500 --throttle-rate 0.02 --archive --delete --batch-archive
+"""
+
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+WORKSPACE, LAKEHOUSE = "bench-ws", "bench-lh"
+LAKEHOUSE_ROOT = f"abfss://{WORKSPACE}@onelake.dfs.fabric.microsoft.com/{LAKEHOUSE}"
+SITE_ID, DRIVE_ID = "site-bench", "drive-bench"
+
+
+# ---- mssparkutils stand-in ----
+class LocalLakehouse:
+    """Maps LAKEHOUSE_ROOT paths onto a local directory for the mssparkutils.fs shim."""
+
+    directory = None
+
+    @classmethod
+    def local(cls, path: str) -> str:
+        if path.startswith("file://"):
+            return path[len("file://"):]
+        if path.startswith(LAKEHOUSE_ROOT):
+            return os.path.join(cls.directory, path[len(LAKEHOUSE_ROOT):].lstrip("/"))
+        raise ValueError(f"Path outside the benchmark lakehouse: {path}")
+
+
+def install_fake_notebookutils():
+    """Registers a `notebookutils` module whose mssparkutils works against LocalLakehouse."""
+
+    def cp(src, dst, recurse=False):
+        target = LocalLakehouse.local(dst)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(LocalLakehouse.local(src), target)
+        return True
+
+    def exists(path):
+        return os.path.exists(LocalLakehouse.local(path))
+
+    def head(path, max_bytes=65536):
+        with open(LocalLakehouse.local(path), encoding="utf-8") as f:
+            return f.read(max_bytes)
+
+    def put(path, content, overwrite=False):
+        target = LocalLakehouse.local(path)
+        if os.path.exists(target) and not overwrite:
+            raise FileExistsError(path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(content)
+        return True
+
+    def append(path, content, create_if_not_exists=False):
+        target = LocalLakehouse.local(path)
+        if not os.path.exists(target) and not create_if_not_exists:
+            raise FileNotFoundError(path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "a", encoding="utf-8") as f:
+            f.write(content)
+        return True
+
+    def rm(path, recurse=False):
+        target = LocalLakehouse.local(path)
+        if os.path.isdir(target):
+            shutil.rmtree(target) if recurse else os.rmdir(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        return True
+
+    fs = types.SimpleNamespace(cp=cp, exists=exists, head=head, put=put, append=append, rm=rm)
+    credentials = types.SimpleNamespace(getToken=lambda audience: "local-storage-token")
+    module = types.ModuleType("notebookutils")
+    module.mssparkutils = types.SimpleNamespace(fs=fs, credentials=credentials)
+    sys.modules["notebookutils"] = module
+    if not hasattr(builtins, "display"):
+        builtins.display = lambda *args, **kwargs: None
+
+
+class StaticTokenProvider:
+    def get_token(self) -> str:
+        return "local-graph-token"
+
+    def invalidate(self, rejected_token: str):
+        pass
+
+
+# ---- Graph / OneLake stand-in ----
+class MockTenant:
+    """In-memory SharePoint folder plus OneLake DFS endpoint with injectable latency and throttling.
+
+    With subfolders, the files are spread over that many dated subfolders that reuse the same
+    file names; each subfolder serves different bytes, so overwritten landings show up as damaged.
+    """
+
+    def __init__(self, folder: str, files: int, size: int, page_size: int, latency_ms: float,
+                 throttle_rate: float, retry_after_sec: float, copy_delay_sec: float, seed: int,
+                 subfolders: int = 0):
+        self.folder = folder
+        self.size = size
+        self.page_size = page_size
+        self.latency_sec = latency_ms / 1000.0
+        self.throttle_rate = throttle_rate
+        self.retry_after_sec = retry_after_sec
+        self.copy_delay_sec = copy_delay_sec
+        self.subfolders = [f"2024-01-{d + 1:02d}" for d in range(subfolders)]
+        if self.subfolders:
+            per_folder = -(-files // len(self.subfolders))
+            self.files = [f"{sub}/file_{i:05d}.csv" for sub in self.subfolders for i in range(per_folder)][:files]
+        else:
+            self.files = [f"file_{i:05d}.csv" for i in range(files)]
+        self.present = set(self.files)
+        self.archives = set()  # folders (relative to the source folder) whose archive subfolder exists
+        self.copies = {}
+        self._payloads = {}
+        for k, sub in enumerate([""] + self.subfolders):
+            data = (b"id,value\n" + b"".join(b"%d,%d\n" % (i, i * 7 + k) for i in range(size // 8 + 1)))[:size]
+            self._payloads[sub] = data[:data.rfind(b"\n") + 1]  # whole rows only, so it stays valid CSV
+        self.base_url = None
+        self.stats = {"requests": 0, "throttled": 0, "bytes_served": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    # -- helpers --
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _throttle(self) -> bool:
+        with self._lock:
+            hit = self._rng.random() < self.throttle_rate
+        if hit:
+            self._count("throttled")
+        return hit
+
+    @staticmethod
+    def _json(status: int, body, headers: dict = None):
+        return status, {"Content-Type": "application/json", **(headers or {})}, json.dumps(body).encode()
+
+    def payload(self, path: str) -> bytes:
+        return self._payloads[os.path.dirname(path)]
+
+    def _item(self, path: str) -> dict:
+        name = os.path.basename(path)
+        return {
+            "id": f"item-{path}", "name": name, "size": len(self.payload(path)),
+            "eTag": f"\"{name},1\"", "cTag": f"\"c:{name},1\"",
+            "file": {"mimeType": "text/csv", "hashes": {"quickXorHash": f"hash-{name}"}},
+            "@microsoft.graph.downloadUrl": f"{self.base_url}/download/{quote(path)}",
+        }
+
+    # -- routing --
+    def handle(self, method: str, raw_path: str, body: bytes, headers: dict):
+        self._count("requests")
+        if self.latency_sec:
+            time.sleep(self.latency_sec)
+        if self.throttle_rate and self._throttle():
+            return self._json(429, {"error": {"code": "tooManyRequests"}}, {"Retry-After": str(self.retry_after_sec)})
+        return self.dispatch(method, raw_path, body, headers)
+
+    def dispatch(self, method: str, raw_path: str, body: bytes, headers: dict):
+        parts = urlsplit(raw_path)
+        path, query = unquote(parts.path), parse_qs(parts.query)
+        graph_drive = f"/v1.0/drives/{DRIVE_ID}"
+        folder_root = f"{graph_drive}/root:/{self.folder}"
+
+        if path.startswith(f"/onelake/{WORKSPACE}/{LAKEHOUSE}/"):
+            return self._dfs(method, path[len(f"/onelake/{WORKSPACE}/{LAKEHOUSE}/"):], query, body, headers)
+        if path.startswith("/download/") and method == "GET":
+            return self._download(path[len("/download/"):], headers)
+        if path.startswith("/monitor/") and method == "GET":
+            ready_at = self.copies.get(path[len("/monitor/"):])
+            if ready_at is None:
+                return self._json(404, {"error": {"code": "itemNotFound"}})
+            done = time.monotonic() >= ready_at
+            return self._json(200 if done else 202, {"status": "completed" if done else "inProgress"})
+        if path == "/v1.0/$batch" and method == "POST":
+            return self._batch(json.loads(body or b"{}"))
+        if path.startswith("/v1.0/sites/") and path.endswith(f"/sites/{path.rsplit('/', 1)[-1]}") and ":" in path:
+            return self._json(200, {"id": SITE_ID})
+        if path == f"/v1.0/sites/{SITE_ID}/drives":
+            return self._json(200, {"value": [{"id": DRIVE_ID, "name": "Documents"}]})
+        if path in (f"/v1.0/sites/{SITE_ID}", graph_drive):
+            return self._json(200, {"id": path.rsplit("/", 1)[-1]})
+        if path.startswith(folder_root):
+            return self._folder_route(method, path[len(folder_root):], query)
+        return self._json(404, {"error": {"code": "itemNotFound", "message": f"No mock route for {method} {path}"}})
+
+    def _folder_route(self, method: str, rest: str, query: dict):
+        # rest is the path after root:/<folder>, e.g. ":/children", "/2024-01-01:/children",
+        # "/2024-01-01/archive", "/2024-01-01/file_00000.csv:/copy" or "/file_00000.csv"
+        if rest.endswith(":/children"):
+            folder = rest[1:-len(":/children")].strip("/")
+            if method == "GET":
+                return self._children(folder, int(query.get("skip", ["0"])[0]))
+            if method == "POST":
+                self.archives.add(folder)
+                return self._json(201, {"id": f"item-{folder}/archive", "name": "archive", "folder": {}})
+        if rest.endswith("/archive") and method == "GET":
+            folder = rest[1:-len("/archive")].strip("/")
+            if folder in self.archives:
+                return self._json(200, {"id": f"item-{folder}/archive"})
+            return self._json(404, {"error": {"code": "itemNotFound"}})
+        if rest.endswith(":/copy") and method == "POST":
+            name = rest[1:-len(":/copy")]
+            if name not in self.present:
+                return self._json(404, {"error": {"code": "itemNotFound"}})
+            copy_id = f"copy-{len(self.copies)}-{name}"
+            self.copies[copy_id] = time.monotonic() + self.copy_delay_sec
+            return 202, {"Location": f"{self.base_url}/monitor/{quote(copy_id)}"}, b""
+        if rest.startswith("/") and method == "DELETE":
+            name = rest[1:]
+            with self._lock:
+                if name not in self.present:
+                    return self._json(404, {"error": {"code": "itemNotFound"}})
+                self.present.discard(name)
+            return 204, {}, b""
+        if rest.startswith("/") and "/archive/" in rest and method == "GET":
+            return self._json(200, {"id": f"item-{rest[1:]}"})  # archive copies always exist once started
+        return self._json(404, {"error": {"code": "itemNotFound", "message": f"No mock route for {method} {rest}"}})
+
+    def _children(self, folder: str, skip: int):
+        in_folder = [f for f in self.files if os.path.dirname(f) == folder]
+        page = [self._item(f) for f in in_folder[skip:skip + self.page_size] if f in self.present]
+        if not folder and not skip:
+            page = [{"id": f"item-{sub}", "name": sub, "folder": {}} for sub in self.subfolders] + page
+        body = {"value": page}
+        if skip + self.page_size < len(in_folder):
+            children_path = quote(f"{self.folder}/{folder}" if folder else self.folder)
+            body["@odata.nextLink"] = (f"{self.base_url}/v1.0/drives/{DRIVE_ID}/root:/{children_path}:/children"
+                                       f"?skip={skip + self.page_size}")
+        return self._json(200, body)
+
+    def _download(self, name: str, headers: dict):
+        if name not in self.present:
+            return self._json(404, {"error": {"code": "itemNotFound"}})
+        payload = self.payload(name)
+        data, status, extra = payload, 200, {}
+        range_header = headers.get("Range")
+        if range_header and range_header.startswith("bytes="):
+            start, _, end = range_header[len("bytes="):].partition("-")
+            start, end = int(start), int(end) if end else len(data) - 1
+            data, status = data[start:end + 1], 206
+            extra["Content-Range"] = f"bytes {start}-{start + len(data) - 1}/{len(payload)}"
+        self._count("bytes_served", len(data))
+        return status, {"Content-Type": "application/octet-stream", **extra}, data
+
+    def _dfs(self, method: str, rel_path: str, query: dict, body: bytes, headers: dict):
+        target = os.path.join(LocalLakehouse.directory, rel_path)
+        rename_source = {k.lower(): v for k, v in headers.items()}.get("x-ms-rename-source")
+        if method == "PUT" and rename_source:
+            source = unquote(rename_source)[len(f"/{WORKSPACE}/{LAKEHOUSE}/"):]
+            os.replace(os.path.join(LocalLakehouse.directory, source), target)
+            return 201, {}, b""
+        if method == "DELETE":
+            if not os.path.exists(target):
+                return self._json(404, {"error": {"code": "PathNotFound"}})
+            os.remove(target)
+            return 200, {}, b""
+        if method == "PUT" and query.get("resource") == ["file"]:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            open(target, "wb").close()
+            return 201, {}, b""
+        if method == "PATCH" and query.get("action") == ["append"]:
+            with open(target, "r+b") as f:
+                f.seek(int(query["position"][0]))
+                f.write(body)
+            return 202, {}, b""
+        if method == "PATCH" and query.get("action") == ["flush"]:
+            with open(target, "r+b") as f:
+                f.truncate(int(query["position"][0]))
+            return 200, {}, b""
+        return self._json(400, {"error": {"code": "InvalidDfsRequest"}})
+
+    def _batch(self, payload: dict):
+        responses = []
+        for sub in payload.get("requests", []):
+            if self.throttle_rate and self._throttle():
+                status, headers, data = 429, {"Retry-After": str(self.retry_after_sec)}, b""
+            else:
+                sub_body = json.dumps(sub["body"]).encode() if "body" in sub else b""
+                status, headers, data = self.dispatch(sub["method"], "/v1.0" + sub["url"], sub_body, {})
+            responses.append({"id": sub["id"], "status": status, "headers": headers,
+                              "body": json.loads(data) if data and headers.get("Content-Type") == "application/json" else None})
+        return self._json(200, {"responses": responses})
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection pooling is measured too
+
+    def _serve(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        status, headers, data = self.server.tenant.handle(self.command, self.path, body, dict(self.headers))
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _serve
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients drop keep-alive connections (e.g. after a 429 or at pool shutdown); that is not a
+        # server fault, and a traceback per drop would drown the results table.
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+# ---- benchmark driver ----
+def landed_intact(path: str, payload: bytes) -> bool:
+    if path.endswith(".parquet"):  # converted on landing: compare contents row by row
+        import pyarrow.parquet as pq
+
+        lines = payload.decode().splitlines()
+        table = pq.read_table(path)
+        return [",".join(v or "" for v in row) for row in zip(*table.to_pydict().values())] == lines[1:]
+    with open(path, "rb") as f:
+        return f.read() == payload
+
+
+def landed_files(landed_dir: str) -> list:
+    # Paths relative to the lakehouse folder, including any subfolders.
+    return [os.path.relpath(os.path.join(root, name), landed_dir)
+            for root, _, names in os.walk(landed_dir) for name in names]
+
+
+def run_once(ingest, args, workers: int, mode: str) -> dict:
+    workdir = tempfile.mkdtemp(prefix="sp-bench-")
+    LocalLakehouse.directory = os.path.join(workdir, "lakehouse")
+    tenant = MockTenant(args.folder, args.files, args.size_kb * 1024, args.page_size, args.latency_ms,
+                        args.throttle_rate, args.retry_after, args.copy_delay, args.seed, args.subfolders)
+    server = MockServer(("127.0.0.1", 0), MockHandler)
+    server.tenant = tenant
+    tenant.base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        range_parallelism = 4  # LakehouseService default
+        transport = ingest.HttpTransport(pool_size=workers * range_parallelism + 2 * workers, max_retries=args.max_retries,
+                                         backoff_base_sec=0.05, backoff_max_sec=1.0)
+        sp = ingest.SharePointService(StaticTokenProvider(), "bench.sharepoint.com", "Bench", transport=transport,
+                                      graph_url=f"{tenant.base_url}/v1.0")
+        discovery = ingest.FileDiscovery(sp, "Bench", max_workers=workers)
+        lakehouse = ingest.LakehouseService(LAKEHOUSE_ROOT, streaming=(mode == "stream"), transport=transport,
+                                           dfs_endpoint=f"{tenant.base_url}/onelake", range_parallelism=range_parallelism)
+        metrics = ingest.RunMetrics(transport=transport)
+        journal = ingest.RunJournal(ingest.LakehouseStateStore(LAKEHOUSE_ROOT), "bench") if args.journal else None
+        orchestrator = ingest.SharePointToLakehouseOrchestrator(sp, discovery, lakehouse, max_workers=workers,
+                                                                batch_archive=args.batch_archive, metrics=metrics,
+                                                                journal=journal)
+        orchestrator.copy_monitor.poll_interval_sec = min(orchestrator.copy_monitor.poll_interval_sec, 0.2)
+        folders = [{"folder_name": args.folder, "lakehouse_folder": "sp_bench",
+                    "copy_to_archive": str(args.archive), "delete_original": str(args.delete),
+                    "recursive": str(args.subfolders > 0), "max_depth": 1,
+                    "convert_to_parquet": str(bool(args.parquet)), "parquet_compression": args.parquet}]
+
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        started = time.perf_counter()
+        with output:
+            orchestrator.run(folders)
+        elapsed = time.perf_counter() - started
+
+        landed_dir = os.path.join(LocalLakehouse.directory, "Files", "sp_bench")
+        landed = landed_files(landed_dir) if os.path.isdir(landed_dir) else []
+        intact = sum(1 for n in landed if landed_intact(os.path.join(landed_dir, n), tenant.payload(n)))
+        summary = metrics.summary()
+        return {
+            "workers": workers, "mode": mode, "elapsed_sec": elapsed,
+            "files_per_sec": summary["files_landed"] / elapsed,
+            "mb_per_sec": summary["bytes"] / (1024 * 1024) / elapsed,
+            "landed": summary["files_landed"], "intact": intact, "failed": summary["files_failed"],
+            "archive_failed": summary["archive_failed"],
+            "deleted": args.files - len(tenant.present),
+            "requests": tenant.stats["requests"], "throttled": tenant.stats["throttled"],
+            "retries": summary["retries"], "throttle_wait_sec": summary["throttle_wait_sec"],
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(workdir, ignore_errors=True)
+        shutil.rmtree(os.path.join("/tmp", "sp_bench"), ignore_errors=True)
+
+
+def median_result(results: list) -> dict:
+    best = dict(results[0])
+    for key in ("elapsed_sec", "files_per_sec", "mb_per_sec", "requests", "throttled", "retries", "throttle_wait_sec"):
+        best[key] = statistics.median(r[key] for r in results)
+    return best
+
+
+def print_table(rows: list):
+    header = f"{'workers':>7} {'mode':>9} {'wall s':>8} {'files/s':>8} {'MB/s':>7} {'landed':>7} {'intact':>7} " \
+             f"{'failed':>6} {'deleted':>7} {'requests':>8} {'429s':>5} {'retries':>7} {'wait s':>7}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['workers']:>7} {r['mode']:>9} {r['elapsed_sec']:>8.2f} {r['files_per_sec']:>8.1f} {r['mb_per_sec']:>7.2f} "
+              f"{r['landed']:>7} {r['intact']:>7} {r['failed']:>6} {r['deleted']:>7} {r['requests']:>8.0f} "
+              f"{r['throttled']:>5.0f} {r['retries']:>7.0f} {r['throttle_wait_sec']:>7.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--files", type=int, default=500, help="files in the mock SharePoint folder")
+    parser.add_argument("--size-kb", type=int, default=64, help="size of each file")
+    parser.add_argument("--page-size", type=int, default=200, help="items per listing page (@odata.nextLink beyond)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="added latency per request")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=0.2, help="Retry-After seconds on injected 429s")
+    parser.add_argument("--subfolders", type=int, default=0,
+                        help="spread files over this many dated subfolders that reuse the same file names")
+    parser.add_argument("--copy-delay", type=float, default=0.0, help="seconds before an archive copy completes")
+    parser.add_argument("--workers", default="1,4,8,16", help="comma-separated worker counts to compare")
+    parser.add_argument("--modes", default="stream,temp_file", help="comma-separated: stream, temp_file")
+    parser.add_argument("--archive", action="store_true", help="copy each file to the archive folder")
+    parser.add_argument("--delete", action="store_true", help="delete originals after confirmed archive copies")
+    parser.add_argument("--batch-archive", action="store_true", help="use Graph $batch for archive/delete")
+    parser.add_argument("--parquet", metavar="CODEC", help="convert CSVs to Parquet on landing (e.g. snappy, zstd)")
+    parser.add_argument("--journal", action="store_true", help="keep a resumable run journal in the lakehouse")
+    parser.add_argument("--max-retries", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per configuration; the median is reported")
+    parser.add_argument("--folder", default="Bench Drop")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", dest="json_path", help="also write results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="show the orchestrator's own output")
+    args = parser.parse_args(argv)
+
+    install_fake_notebookutils()
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import sharepoint_to_bronze_delta as ingest
+
+    print(f"{args.files} files x {args.size_kb} KB, page size {args.page_size}, latency {args.latency_ms} ms, "
+          f"429 rate {args.throttle_rate:.1%}, archive={args.archive} delete={args.delete} batch={args.batch_archive}")
+    rows = []
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+            rows.append(median_result([run_once(ingest, args, workers, mode) for _ in range(args.repeat)]))
+    print_table(rows)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": rows}, f, indent=2)
+    return rows
+
+
+if __name__ == "__main__":
+    main()
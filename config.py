@@ -13,25 +13,59 @@ config ={
     "sales_usa": {
       "source_folder": "/Files/sales_usa/",  # Customize your source folder path
       "archive_folder": "/Files/sales_usa/archives",  # Customize your archive folder path
-      "sink_table": "/Tables/dbo/sales_transaction"  # Customize your table path
+      "sink_table": "/Tables/dbo/sales_transaction"  # Delta table that files landed in lakehouse_folder "sales_usa" are appended to
     }
   },
   "sharepoint": {
     "hostname": "yourcompany.sharepoint.com",  # Replace with your SharePoint hostname
     "site_path": "YourSiteName",  # Replace with your SharePoint site path
+    "drive_name": "",  # Optional document library name (empty = first library that isn't "Teams Wiki Data")
     "source_folder_list": [
       {
         "folder_name": "Your Source Folder",  # Replace with your SharePoint folder name
         "copy_to_archive": "True",  # Set to "True" to archive files
         "delete_original": "True",  # Set to "True" to delete originals after archiving
+        "incremental": "False",  # Set to "True" to fetch only new/changed files via Graph delta queries
+        "recursive": "False",  # Set to "True" to also ingest files from subfolders
+        "max_depth": 10,  # Subfolder levels to descend when recursive
+        "include": ["*.csv", "*.xlsx", "*.parquet"],  # Glob patterns or extensions to ingest (empty = all files)
+        "exclude": ["~$*"],  # Glob patterns or extensions to skip (e.g. Office lock files)
+        "convert_to_parquet": "False",  # Set to "True" to land CSV/Excel files as Parquet
+        "parquet_compression": "snappy",  # Parquet codec when converting: snappy, zstd, gzip, lz4 or none
+        "keep_original": "False",  # Set to "True" to also land the original file next to the Parquet copy
         "lakehouse_folder": "sales_usa"  # Replace with your target lakehouse folder
       }
-    ]
+    ],
+    # Optional: ingest from several sites/drives in one run. When set, it replaces
+    # hostname/site_path/drive_name/source_folder_list above. Example entry:
+    # {"hostname": "yourcompany.sharepoint.com", "site_path": "OtherSite", "drive_name": "Documents",
+    #  "source_folder_list": [{"folder_name": "Exports", "lakehouse_folder": "sales_usa"}]}
+    "sites": []
+  },
+  "ingestion": {
+    "max_workers": 8,  # Number of files downloaded/uploaded concurrently (1 = sequential)
+    "preview": "False",  # Set to "True" to display the discovered files as a DataFrame before transferring
+    "max_parallel_sources": 4,  # Sites/drives discovered and archived at the same time (multi-site runs)
+    "max_workers_per_site": 4,  # Per-site cap on in-flight transfers so one site can't starve the others
+    "id_cache_ttl_hours": 24,  # How long resolved site/drive IDs are reused across runs (0 = always resolve)
+    "max_retries": 5,  # Retries per HTTP call on throttling (429/503) and transient errors
+    "max_requests_per_sec": 0,  # Global cap on HTTP requests per second across all workers (0 = no cap)
+    "streaming_upload": "True",  # Stream downloads straight to OneLake instead of staging in /tmp
+    "stream_chunk_mb": 8,  # Buffer size per in-flight chunk when streaming
+    "ranged_download_threshold_mb": 256,  # Files at or above this size are fetched in resumable byte ranges
+    "ranged_download_parallelism": 4,  # Byte ranges of one large file downloaded and appended to OneLake at once
+    "batch_archive": "False",  # Set to "True" to send archive copies/deletes as Graph $batch calls of up to 20
+    "load_to_delta": "True",  # Append landed files to the bronze sink_table of their lakehouse_folder
+    "skip_unchanged": "True",  # Skip files whose cTag/quickXorHash match the ingestion manifest
+    "manifest_table": "/Tables/dbo/_ingest_manifest",  # Delta table holding the ingestion manifest
+    "metrics_table": "/Tables/dbo/_ingest_run_metrics",  # Delta table for per-file run metrics (empty = don't persist)
+    "resume_journal": "True"  # Keep a per-file run journal under Files/_ingest_state/journal so interrupted runs resume
   },
   "azure-authentication": {
     "tenant_id": "zzzzzzzz-zzzz-zzzz-zzzz-zzzzzzzzzzzz",  # Replace with your Azure AD tenant ID
     "appreg_siteselect_client_id": "aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa",  # Replace with your App Registration client ID
-    "appreg_siteselect_client_secret": "your_client_secret_here"  # Replace with your App Registration client secret
+    "appreg_siteselect_client_secret": "your_client_secret_here",  # Replace with your App Registration client secret
+    "persist_token_cache": "False"  # Set to "True" to keep the MSAL token cache in the lakehouse between sessions
   }
 }
 
@@ -2,235 +2,2100 @@
 
 
 import requests
-import pandas as pd
+from requests.adapters import HTTPAdapter
 
-from msal import ConfidentialClientApplication
+from msal import ConfidentialClientApplication, SerializableTokenCache
 from notebookutils import mssparkutils
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import quote
+import fnmatch
+import io
+import json
 import os
+import random
+import re
+import threading
+import time
+import uuid
 import pytz
 
 
 
 class AzureAuthenticator:
-    def __init__(self, tenant_id: str, client_id: str, client_secret: str):
+    def __init__(self, tenant_id: str, client_id: str, client_secret: str, cache_store=None, cache_key: str = None):
         self.tenant_id = tenant_id
         self.client_id = client_id
         self.client_secret = client_secret
+        # Optional persistent MSAL cache (any object with read_json/write_json, e.g. LakehouseStateStore)
+        self.cache_store = cache_store
+        self.cache_key = cache_key or f"msal_cache_{client_id}"
+        self.token_cache = SerializableTokenCache()
+        if self.cache_store is not None:
+            try:
+                cached = self.cache_store.read_json(self.cache_key)
+                if cached:
+                    self.token_cache.deserialize(json.dumps(cached))
+            except Exception as e:
+                print(f"ℹ️ Ignoring unreadable token cache: {e}")
         self.app = ConfidentialClientApplication(
             client_id=self.client_id,
             authority=f"https://login.microsoftonline.com/{self.tenant_id}",
-            client_credential=self.client_secret
+            client_credential=self.client_secret,
+            token_cache=self.token_cache
         )
 
-    def get_access_token(self) -> str:
+    def acquire_token(self, force_refresh: bool = False) -> dict:
         scopes = ["https://graph.microsoft.com/.default"]
+        if force_refresh and hasattr(self.app, "remove_tokens_for_client"):
+            self.app.remove_tokens_for_client()
         result = self.app.acquire_token_for_client(scopes=scopes)
-        if "access_token" in result:
-            print("Access token acquired successfully!")
-            return result["access_token"]
-        raise RuntimeError(f"Failed to acquire access token: {result}")
+        if "access_token" not in result:
+            raise RuntimeError(f"Failed to acquire access token: {result}")
+        if self.cache_store is not None and self.token_cache.has_state_changed:
+            try:
+                self.cache_store.write_json(self.cache_key, json.loads(self.token_cache.serialize()))
+                self.token_cache.has_state_changed = False
+            except Exception as e:
+                print(f"ℹ️ Could not persist token cache: {e}")
+        return result
+
+    def get_access_token(self) -> str:
+        result = self.acquire_token()
+        print("Access token acquired successfully!")
+        return result["access_token"]
+
+
+class TokenProvider:
+    """Thread-safe cached Graph token that refreshes itself shortly before expiry.
+
+    Concurrent workers share one instance; only the first caller past the refresh
+    point talks to the authority, the others wait on the lock and reuse its token.
+    """
+
+    def __init__(self, authenticator: AzureAuthenticator, refresh_margin_sec: int = 300):
+        self.authenticator = authenticator
+        self.refresh_margin_sec = refresh_margin_sec
+        self._token = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self) -> bool:
+        return self._token is not None and time.time() < self._expires_at - self.refresh_margin_sec
+
+    def get_token(self) -> str:
+        if self._fresh():
+            return self._token
+        with self._lock:
+            if not self._fresh():
+                self._refresh(force=False)
+            return self._token
+
+    def _refresh(self, force: bool):
+        result = self.authenticator.acquire_token(force_refresh=force)
+        self._token = result["access_token"]
+        self._expires_at = time.time() + int(result.get("expires_in", 3599))
+        print(f"Access token acquired, valid for {int(result.get('expires_in', 3599)) // 60} min.")
+
+    def invalidate(self, rejected_token: str):
+        # Forces a new token after a 401, unless another thread already replaced it.
+        with self._lock:
+            if self._token == rejected_token:
+                self._refresh(force=True)
+
+
+class HttpTransport:
+    """Shared keep-alive HTTP session with throttling-aware retries and a global rate governor.
+
+    - connection pool sized to the worker count, so TLS connections are reused
+    - 429/503 honour Retry-After and pause *all* workers until it elapses
+    - other transient failures back off exponentially with full jitter
+    - max_requests_per_sec (if set) caps the request rate across all threads
+    - non-idempotent calls (POST/PATCH unless marked idempotent) are only retried on 429/503 or a
+      connect timeout, i.e. when the request was never processed; a blind retry could repeat a copy
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    UNPROCESSED_STATUSES = (429, 503)
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+    def __init__(self, pool_size: int = 8, max_retries: int = 5, backoff_base_sec: float = 1.0,
+                 backoff_max_sec: float = 60.0, max_requests_per_sec: float = 0, timeout_sec: int = 120):
+        self.max_retries = max_retries
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec = backoff_max_sec
+        self.timeout_sec = timeout_sec
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._min_interval = 1.0 / max_requests_per_sec if max_requests_per_sec else 0.0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._local = threading.local()  # per-thread retry/throttle counters, read by RunMetrics
+        self.total_retries = 0
+        self.total_throttle_wait_sec = 0.0
+
+    def _count(self, retries: int = 0, throttle_wait_sec: float = 0.0):
+        self._local.retries = getattr(self._local, "retries", 0) + retries
+        self._local.throttle_wait_sec = getattr(self._local, "throttle_wait_sec", 0.0) + throttle_wait_sec
+        with self._lock:
+            self.total_retries += retries
+            self.total_throttle_wait_sec += throttle_wait_sec
+
+    def thread_stats(self, reset: bool = False) -> dict:
+        stats = {"retries": getattr(self._local, "retries", 0),
+                 "throttle_wait_sec": getattr(self._local, "throttle_wait_sec", 0.0)}
+        if reset:
+            self._local.retries, self._local.throttle_wait_sec = 0, 0.0
+        return stats
+
+    def _wait_turn(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot, self._paused_until)
+            self._next_slot = slot + self._min_interval
+        if slot > now:
+            time.sleep(slot - now)
+            self._count(throttle_wait_sec=slot - now)
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max_sec, self.backoff_base_sec * (2 ** attempt)))
+
+    @staticmethod
+    def _retry_after(resp) -> float:
+        value = resp.headers.get("Retry-After")
+        try:
+            return float(value) if value is not None else None
+        except ValueError:
+            return None
+
+    def request(self, method: str, url: str, idempotent: bool = None, **kwargs):
+        kwargs.setdefault("timeout", self.timeout_sec)
+        if idempotent is None:
+            idempotent = method.upper() in self.IDEMPOTENT_METHODS
+        retry_statuses = self.RETRY_STATUSES if idempotent else self.UNPROCESSED_STATUSES
+        attempt = 0
+        while True:
+            self._wait_turn()
+            try:
+                resp = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries or not (idempotent or isinstance(e, requests.ConnectTimeout)):
+                    raise
+                delay = self._backoff(attempt)
+                self._count(retries=1)
+                print(f"↻ {method} failed ({e.__class__.__name__}); retrying in {delay:.1f}s")
+            else:
+                if resp.status_code not in retry_statuses or attempt >= self.max_retries:
+                    return resp
+                retry_after = self._retry_after(resp)
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+                if resp.status_code in (429, 503):
+                    with self._lock:
+                        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                    self._count(retries=1, throttle_wait_sec=delay)
+                    print(f"⏳ Throttled ({resp.status_code}); pausing requests for {delay:.1f}s")
+                else:
+                    self._count(retries=1)
+                resp.close()
+            time.sleep(delay)
+            attempt += 1
+
+
+class ResolutionCache:
+    """Persistent site/drive ID lookups keyed by hostname, site_path and drive name.
+
+    Entries older than ttl_sec are ignored. The backing store is any object with
+    read_json/write_json (e.g. LakehouseStateStore), so the cache survives sessions.
+    """
+
+    def __init__(self, store, ttl_sec: int = 24 * 3600, key: str = "resolution_cache"):
+        self.store = store
+        self.ttl_sec = ttl_sec
+        self.key = key
+        self._entries = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(hostname: str, site_path: str, drive_name: str = None, kind: str = "site") -> str:
+        return "|".join([kind, hostname, site_path, drive_name or ""])
+
+    def _ensure_loaded(self):
+        if self._entries is None:
+            try:
+                self._entries = self.store.read_json(self.key, {}) or {}
+            except Exception as e:
+                print(f"ℹ️ Ignoring unreadable resolution cache: {e}")
+                self._entries = {}
+
+    def _save(self):
+        try:
+            self.store.write_json(self.key, self._entries)
+        except Exception as e:
+            print(f"ℹ️ Could not persist resolution cache: {e}")
+
+    def get(self, hostname: str, site_path: str, drive_name: str = None, kind: str = "site"):
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(self._key(hostname, site_path, drive_name, kind))
+        if entry and time.time() - entry.get("resolved_at", 0) < self.ttl_sec:
+            return entry["id"]
+        return None
+
+    def put(self, hostname: str, site_path: str, value: str, drive_name: str = None, kind: str = "site"):
+        with self._lock:
+            self._ensure_loaded()
+            self._entries[self._key(hostname, site_path, drive_name, kind)] = {"id": value, "resolved_at": time.time()}
+            self._save()
+
+    def invalidate(self, hostname: str, site_path: str, drive_name: str = None, kind: str = None):
+        # kind=None drops the site and every drive cached under it.
+        prefix = "|".join([hostname, site_path]) + "|"
+        with self._lock:
+            self._ensure_loaded()
+            stale = [k for k in self._entries
+                     if k.split("|", 1)[1].startswith(prefix)
+                     and (kind is None or self._key(hostname, site_path, drive_name, kind) == k)]
+            for k in stale:
+                del self._entries[k]
+            if stale:
+                self._save()
 
 
 # In[12]:
 
 
 class SharePointService:
-    def __init__(self, access_token: str, hostname: str, site_path: str, timeout_sec: int = 120):
-        self.access_token = access_token
+    GRAPH_URL = "https://graph.microsoft.com/v1.0"
+
+    def __init__(self, token_provider: TokenProvider, hostname: str, site_path: str, timeout_sec: int = 120,
+                 transport: HttpTransport = None, resolution_cache: ResolutionCache = None, graph_url: str = None):
+        self.token_provider = token_provider
         self.hostname = hostname
         self.site_path = site_path
         self.timeout_sec = timeout_sec
+        self.graph_url = (graph_url or self.GRAPH_URL).rstrip("/")
+        self.transport = transport or HttpTransport(timeout_sec=timeout_sec)
+        self._known_folders = set()
+        self._folders_lock = threading.Lock()
+        self._site_id = None
+        self._drive_ids = {}
+        self._ids_lock = threading.RLock()  # re-entered when a 404 during resolution triggers id checks
+        self.resolution_cache = resolution_cache
 
     # ------------- helpers -------------
-    def _headers(self):
-        return {"Authorization": f"Bearer {self.access_token}", "Accept": "application/json"}
+    def _headers(self, token: str = None):
+        return {"Authorization": f"Bearer {token or self.token_provider.get_token()}", "Accept": "application/json"}
+
+    def _request(self, method: str, url: str, check_ids: bool = True, **kwargs):
+        # Retries once with a refreshed token when Graph answers 401.
+        token = self.token_provider.get_token()
+        resp = self.transport.request(method, url, headers=self._headers(token), timeout=self.timeout_sec, **kwargs)
+        if resp.status_code == 401:
+            self.token_provider.invalidate(token)
+            resp = self.transport.request(method, url, headers=self._headers(), timeout=self.timeout_sec, **kwargs)
+        if resp.status_code == 404 and check_ids:
+            self._verify_ids_after_404(url)
+        return resp
+
+    def _verify_ids_after_404(self, url: str):
+        # A 404 usually means a missing item (e.g. an archive folder not created yet), so only
+        # forget cached ids once a direct lookup confirms the site or drive itself is gone.
+        with self._ids_lock:
+            drives = [(k, v) for k, v in self._drive_ids.items() if v in url]
+            site_id = self._site_id if self._site_id and self._site_id in url else None
+        for (drive_site_id, drive_name), drive_id in drives:
+            check = self._request("GET", f"{self.graph_url}/drives/{drive_id}?$select=id", check_ids=False)
+            if check.status_code == 404:
+                print(f"ℹ️ Drive {drive_id} no longer exists; dropping cached id")
+                with self._ids_lock:
+                    self._drive_ids.pop((drive_site_id, drive_name), None)
+                if self.resolution_cache is not None:
+                    self.resolution_cache.invalidate(self.hostname, self.site_path, drive_name, kind="drive")
+                site_id = site_id or drive_site_id
+        if site_id:
+            check = self._request("GET", f"{self.graph_url}/sites/{site_id}?$select=id", check_ids=False)
+            if check.status_code == 404:
+                print(f"ℹ️ Site {site_id} no longer exists; dropping cached ids")
+                with self._ids_lock:
+                    self._site_id = None
+                    self._drive_ids.clear()
+                if self.resolution_cache is not None:
+                    self.resolution_cache.invalidate(self.hostname, self.site_path)
 
     # ------------- site / drive -------------
     def get_site_id(self) -> str:
-        url = f"https://graph.microsoft.com/v1.0/sites/{self.hostname}:/sites/{self.site_path}"
-        resp = requests.get(url, headers=self._headers(), timeout=self.timeout_sec)
-        if resp.status_code == 200:
-            site_id = resp.json().get("id", "")
-            print(f"Site ID: {site_id}")
-            return site_id
+        # Resolved once per instance; every drive of the site reuses the answer.
+        with self._ids_lock:
+            if self._site_id:
+                return self._site_id
+            if self.resolution_cache is not None:
+                self._site_id = self.resolution_cache.get(self.hostname, self.site_path)
+                if self._site_id:
+                    print(f"Site ID: {self._site_id} (cached)")
+                    return self._site_id
+            url = f"{self.graph_url}/sites/{self.hostname}:/sites/{self.site_path}"
+            resp = self._request("GET", url, check_ids=False)
+            if resp.status_code == 200:
+                self._site_id = resp.json().get("id", "")
+                print(f"Site ID: {self._site_id}")
+                if self.resolution_cache is not None:
+                    self.resolution_cache.put(self.hostname, self.site_path, self._site_id)
+                return self._site_id
         raise RuntimeError(f"Failed to retrieve site ID. Status: {resp.status_code} | {resp.text}")
 
-    def get_document_drive_id(self, site_id: str) -> str:
-        url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives"
-        resp = requests.get(url, headers=self._headers(), timeout=self.timeout_sec)
-        if resp.status_code != 200:
-            raise RuntimeError(f"Failed to retrieve drive list. Status: {resp.status_code} | {resp.text}")
-        drives = resp.json().get("value", [])
-        doc_drive = next((d for d in drives if d.get("name") != "Teams Wiki Data"), None)
-        if not doc_drive:
-            raise RuntimeError("No suitable document library found.")
-        return doc_drive["id"]
+    def get_document_drive_id(self, site_id: str, drive_name: str = None) -> str:
+        """Returns the named document library, or the first one that isn't "Teams Wiki Data"."""
+        with self._ids_lock:
+            if (site_id, drive_name) in self._drive_ids:
+                return self._drive_ids[(site_id, drive_name)]
+            if self.resolution_cache is not None:
+                cached = self.resolution_cache.get(self.hostname, self.site_path, drive_name, kind="drive")
+                if cached:
+                    self._drive_ids[(site_id, drive_name)] = cached
+                    return cached
+            url = f"{self.graph_url}/sites/{site_id}/drives"
+            drives = []
+            for page in self._get_pages(url, "drives"):
+                drives.extend(page.get("value", []))
+            if drive_name:
+                doc_drive = next((d for d in drives if d.get("name") == drive_name), None)
+            else:
+                doc_drive = next((d for d in drives if d.get("name") != "Teams Wiki Data"), None)
+            if not doc_drive:
+                raise RuntimeError(f"No suitable document library found{f' named {drive_name!r}' if drive_name else ''}.")
+            self._drive_ids[(site_id, drive_name)] = doc_drive["id"]
+            if self.resolution_cache is not None:
+                self.resolution_cache.put(self.hostname, self.site_path, doc_drive["id"], drive_name, kind="drive")
+            return doc_drive["id"]
 
     # ------------- folders / files -------------
+    def _get_pages(self, url: str, what: str):
+        # Follows @odata.nextLink; yields each page's JSON body.
+        while url:
+            resp = self._request("GET", url)
+            if resp.status_code != 200:
+                raise RuntimeError(f"Failed to list {what}. Status: {resp.status_code} | {resp.text}")
+            page = resp.json()
+            yield page
+            url = page.get("@odata.nextLink")
+
+    def iter_folder_children(self, drive_id: str, folder_name: str):
+        # Yields items page by page, so callers can start on the first page while the rest load.
+        url = f"{self.graph_url}/drives/{drive_id}/root:/{folder_name}:/children"
+        for page in self._get_pages(url, f"children for '{folder_name}'"):
+            yield from page.get("value", [])
+
     def list_folder_children(self, drive_id: str, folder_name: str):
-        url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{folder_name}:/children"
-        resp = requests.get(url, headers=self._headers(), timeout=self.timeout_sec)
+        return list(self.iter_folder_children(drive_id, folder_name))
+
+    def get_item(self, drive_id: str, item_path: str) -> dict:
+        url = f"{self.graph_url}/drives/{drive_id}/root:/{item_path}"
+        resp = self._request("GET", url)
         if resp.status_code == 200:
-            return resp.json().get("value", [])
-        raise RuntimeError(f"Failed to list children for '{folder_name}'. Status: {resp.status_code} | {resp.text}")
+            return resp.json()
+        raise RuntimeError(f"Failed to retrieve '{item_path}'. Status: {resp.status_code} | {resp.text}")
 
-    # ------------- archive / delete -------------
-    def ensure_archive_folder(self, drive_id: str, archive_folder_path: str):
-        check_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{archive_folder_path}"
-        resp = requests.get(check_url, headers=self._headers(), timeout=self.timeout_sec)
+    def get_download_url(self, drive_id: str, item_id: str) -> str:
+        url = f"{self.graph_url}/drives/{drive_id}/items/{item_id}"
+        resp = self._request("GET", url)
         if resp.status_code == 200:
-            return  # exists
+            return resp.json()["@microsoft.graph.downloadUrl"]
+        raise RuntimeError(f"Failed to retrieve download URL for item {item_id}. Status: {resp.status_code} | {resp.text}")
 
-        parent, sub = archive_folder_path.rsplit("/", 1) if "/" in archive_folder_path else ("", archive_folder_path)
-        create_url = (
-            f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{parent}:/children"
-            if parent else f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root/children"
-        )
-        payload = {"name": sub, "folder": {}}
-        cr = requests.post(create_url, json=payload, headers=self._headers(), timeout=self.timeout_sec)
-        if cr.status_code not in (200, 201):
-            raise RuntimeError(f"Failed to create archive folder '{archive_folder_path}': {cr.status_code} | {cr.text}")
+    def list_drive_delta(self, drive_id: str, delta_link: str = None):
+        # SharePoint only supports delta on the drive root; callers filter by parent id.
+        # Returns (changed_items, next_delta_link). Without a delta_link this is the initial full sync.
+        url = delta_link or f"{self.graph_url}/drives/{drive_id}/root/delta"
+        items, next_delta_link = [], None
+        for page in self._get_pages(url, "drive delta"):
+            items.extend(page.get("value", []))
+            next_delta_link = page.get("@odata.deltaLink", next_delta_link)
+        return items, next_delta_link
+
+    # ------------- archive / delete -------------
+    def reset_folder_cache(self):
+        with self._folders_lock:
+            self._known_folders.clear()
+
+    def ensure_archive_folder(self, drive_id: str, archive_folder_path: str):
+        # Existence is cached per instance so a run checks each archive folder once.
+        if (drive_id, archive_folder_path) in self._known_folders:
+            return
+        check_url = f"{self.graph_url}/drives/{drive_id}/root:/{archive_folder_path}"
+        resp = self._request("GET", check_url)
+        if resp.status_code != 200:
+            parent, sub = archive_folder_path.rsplit("/", 1) if "/" in archive_folder_path else ("", archive_folder_path)
+            create_url = (
+                f"{self.graph_url}/drives/{drive_id}/root:/{parent}:/children"
+                if parent else f"{self.graph_url}/drives/{drive_id}/root/children"
+            )
+            payload = {"name": sub, "folder": {}}
+            cr = self._request("POST", create_url, json=payload)
+            if cr.status_code not in (200, 201):
+                raise RuntimeError(f"Failed to create archive folder '{archive_folder_path}': {cr.status_code} | {cr.text}")
+        with self._folders_lock:
+            self._known_folders.add((drive_id, archive_folder_path))
 
     def copy_to_archive(self, drive_id: str, folder_name: str, original_file_name: str,
                         archive_folder_path: str, archive_file_name: str):
-        copy_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{folder_name}/{original_file_name}:/copy"
+        copy_url = f"{self.graph_url}/drives/{drive_id}/root:/{folder_name}/{original_file_name}:/copy"
         payload = {"parentReference": {"driveId": drive_id, "path": f"/drive/root:/{archive_folder_path}"},
                    "name": archive_file_name}
-        resp = requests.post(copy_url, json=payload, headers=self._headers(), timeout=self.timeout_sec)
+        resp = self._request("POST", copy_url, json=payload)
         if resp.status_code not in (200, 202):
             raise RuntimeError(f"Failed to copy to archive. Status: {resp.status_code} | {resp.text}")
+        # 202 means the copy runs asynchronously; the Location header is its monitor URL.
+        return resp.status_code, resp.headers.get("Location")
 
     def delete_original(self, drive_id: str, folder_name: str, original_file_name: str):
-        del_url = f"https://graph.microsoft.com/v1.0/drives/{drive_id}/root:/{folder_name}/{original_file_name}"
-        resp = requests.delete(del_url, headers=self._headers(), timeout=self.timeout_sec)
+        del_url = f"{self.graph_url}/drives/{drive_id}/root:/{folder_name}/{original_file_name}"
+        resp = self._request("DELETE", del_url)
         if resp.status_code != 204:
             raise RuntimeError(f"Failed to delete original file. Status: {resp.status_code} | {resp.text}")
 
+    # ------------- JSON batching -------------
+    BATCH_LIMIT = 20  # Graph $batch maximum
+
+    def batch(self, sub_requests: list) -> list:
+        """Sends sub-requests through Graph $batch, 20 per call.
+
+        Returns one {"status", "headers", "body"} dict per sub-request, in input order.
+        Sub-requests throttled inside a batch are resent after their Retry-After.
+        """
+        results = [None] * len(sub_requests)
+        pending, attempt = list(range(len(sub_requests))), 0
+        while pending:
+            throttled, wait = [], 0.0
+            for start in range(0, len(pending), self.BATCH_LIMIT):
+                chunk = pending[start:start + self.BATCH_LIMIT]
+                body = {"requests": [{"id": str(i), **sub_requests[i]} for i in chunk]}
+                resp = self._request("POST", f"{self.graph_url}/$batch", json=body)
+                if resp.status_code != 200:
+                    raise RuntimeError(f"Batch request failed. Status: {resp.status_code} | {resp.text}")
+                for r in resp.json().get("responses", []):
+                    i = int(r["id"])
+                    if r.get("status") in (429, 503) and attempt < self.transport.max_retries:
+                        throttled.append(i)
+                        retry_after = (r.get("headers") or {}).get("Retry-After")
+                        wait = max(wait, float(retry_after) if retry_after else 2 ** attempt)
+                    else:
+                        results[i] = r
+            if throttled:
+                print(f"⏳ {len(throttled)} batched request(s) throttled; retrying in {wait:.1f}s")
+                time.sleep(wait)
+            pending, attempt = sorted(throttled), attempt + 1
+        return results
+
+    @staticmethod
+    def _item_path(drive_id: str, path: str) -> str:
+        return f"/drives/{drive_id}/root:/{quote(path, safe='/')}"
+
+    @staticmethod
+    def batch_header(result: dict, name: str):
+        headers = result.get("headers") or {}
+        return next((v for k, v in headers.items() if k.lower() == name.lower()), None)
+
+    @staticmethod
+    def _batch_error(result: dict) -> str:
+        body = result.get("body") or {}
+        message = body.get("error", {}).get("message") if isinstance(body, dict) else body
+        return f"Status: {result.get('status')} | {message}"
+
+    def copy_to_archive_many(self, drive_id: str, jobs: list) -> list:
+        """jobs: dicts with folder_name, file_name, archive_folder_path, archive_file_name.
+        Returns (ok, result) per job, where result is the raw batch response."""
+        sub_requests = [{
+            "method": "POST",
+            "url": f"{self._item_path(drive_id, j['folder_name'] + '/' + j['file_name'])}:/copy",
+            "headers": {"Content-Type": "application/json"},
+            "body": {"parentReference": {"driveId": drive_id, "path": f"/drive/root:/{j['archive_folder_path']}"},
+                     "name": j["archive_file_name"]},
+        } for j in jobs]
+        return [(r.get("status") in (200, 202), r) for r in self.batch(sub_requests)]
+
+    def delete_originals_many(self, drive_id: str, jobs: list) -> list:
+        """jobs: dicts with folder_name, file_name. Returns (ok, result) per job."""
+        sub_requests = [{"method": "DELETE", "url": self._item_path(drive_id, j["folder_name"] + "/" + j["file_name"])}
+                        for j in jobs]
+        return [(r.get("status") == 204, r) for r in self.batch(sub_requests)]
+
 
 # In[13]:
 
 
+class LakehouseStateStore:
+    """Small JSON documents persisted under the lakehouse, e.g. delta tokens."""
+
+    def __init__(self, lakehouse_root: str, state_folder: str = "_ingest_state"):
+        self.base_path = f"{lakehouse_root}/Files/{state_folder}"
+
+    def _path(self, key: str) -> str:
+        return f"{self.base_path}/{re.sub(r'[^A-Za-z0-9_.-]+', '_', key)}.json"
+
+    def read_json(self, key: str, default=None):
+        path = self._path(key)
+        if not mssparkutils.fs.exists(path):
+            return default
+        return json.loads(mssparkutils.fs.head(path, 64 * 1024 * 1024))
+
+    def write_json(self, key: str, value):
+        mssparkutils.fs.put(self._path(key), json.dumps(value), True)
+
+
+class IngestManifest:
+    """Delta-backed record of every drive item already landed, used to skip unchanged files.
+
+    The table is loaded once per run into a dict keyed by (drive_id, item_id), so each
+    lookup during discovery is O(1) regardless of manifest size.
+    """
+
+    COLUMNS = ["drive_id", "item_id", "file_name", "etag", "ctag", "size", "quick_xor_hash", "last_ingested_at"]
+
+    def __init__(self, spark, table_path: str, tz: str = "Asia/Kuala_Lumpur"):
+        self.spark = spark
+        self.table_path = table_path
+        self.tz = tz
+        self._entries = None
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one MERGE at a time when several sources share the manifest
+
+    def _load(self):
+        from delta.tables import DeltaTable
+
+        entries = {}
+        if DeltaTable.isDeltaTable(self.spark, self.table_path):
+            df = self.spark.read.format("delta").load(self.table_path).select("drive_id", "item_id", "ctag", "size", "quick_xor_hash")
+            for r in df.toLocalIterator():
+                entries[(r["drive_id"], r["item_id"])] = (r["ctag"], r["size"], r["quick_xor_hash"])
+        self._entries = entries
+        print(f"Loaded ingestion manifest: {len(entries)} entries")
+
+    def is_unchanged(self, drive_id: str, item: dict) -> bool:
+        if self._entries is None:
+            with self._flush_lock:
+                if self._entries is None:
+                    self._load()
+        known = self._entries.get((drive_id, item.get("id")))
+        if known is None:
+            return False
+        ctag, size, quick_xor_hash = known
+        item_hash = ((item.get("file") or {}).get("hashes") or {}).get("quickXorHash")
+        if ctag and ctag == item.get("cTag"):
+            return True
+        return bool(quick_xor_hash) and quick_xor_hash == item_hash and size == item.get("size")
+
+    def record(self, row):
+        # Called by the orchestrator once a file has landed, loaded and been archived; flushed in one MERGE per run.
+        entry = {
+            "drive_id": row.drive_id,
+            "item_id": row.item_id,
+            "file_name": row.file_name,
+            "etag": row.etag,
+            "ctag": row.ctag,
+            "size": int(row.size) if row.size is not None else None,
+            "quick_xor_hash": row.quick_xor_hash,
+            "last_ingested_at": datetime.now(pytz.timezone(self.tz)).replace(tzinfo=None),
+        }
+        with self._lock:
+            self._pending[(entry["drive_id"], entry["item_id"])] = entry
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        from delta.tables import DeltaTable
+
+        with self._lock:
+            pending, self._pending = list(self._pending.values()), {}
+        if not pending:
+            return 0
+        schema = ("drive_id string, item_id string, file_name string, etag string, ctag string, "
+                  "size long, quick_xor_hash string, last_ingested_at timestamp")
+        updates = self.spark.createDataFrame([[e[c] for c in self.COLUMNS] for e in pending], schema)
+        if DeltaTable.isDeltaTable(self.spark, self.table_path):
+            (DeltaTable.forPath(self.spark, self.table_path).alias("m")
+                .merge(updates.alias("u"), "m.drive_id = u.drive_id AND m.item_id = u.item_id")
+                .whenMatchedUpdateAll()
+                .whenNotMatchedInsertAll()
+                .execute())
+        else:
+            updates.write.format("delta").mode("overwrite").save(self.table_path)
+        if self._entries is not None:
+            for e in pending:
+                self._entries[(e["drive_id"], e["item_id"])] = (e["ctag"], e["size"], e["quick_xor_hash"])
+        print(f"Updated ingestion manifest: {len(pending)} entries")
+        return len(pending)
+
+
+class RunJournal:
+    """Append-only per-file progress log in the lakehouse, so an interrupted run can resume.
+
+    Each line records one step of a file's lifecycle (discovered -> landed -> archived -> deleted,
+    plus "loaded" once its rows are in the bronze table). Lines are buffered and appended in small
+    groups; losing the last group in a crash only means those steps are redone.
+    """
+
+    STATES = ("discovered", "landed", "archived", "deleted")
+
+    def __init__(self, state_store: LakehouseStateStore, name: str, flush_every: int = 50,
+                 flush_interval_sec: float = 10.0):
+        self.path = f"{state_store.base_path}/journal/{re.sub(r'[^A-Za-z0-9_.-]+', '_', name)}.jsonl"
+        self.flush_every = flush_every
+        self.flush_interval_sec = flush_interval_sec
+        self._entries = {}  # key -> latest merged record
+        self._seen = set()  # keys touched by the current run
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(row) -> str:
+        return f"{row.drive_id}|{row.item_id}"
+
+    def _merge(self, rec: dict):
+        # A new "discovered" line starts the file over (e.g. a new version); later steps add to it.
+        if rec.get("state") == "discovered":
+            self._entries[rec["key"]] = dict(rec)
+        else:
+            self._entries.setdefault(rec["key"], {}).update(rec)
+
+    def load(self) -> int:
+        with self._lock:
+            self._entries, self._seen, self._buffer = {}, set(), []
+            if mssparkutils.fs.exists(self.path):
+                for line in mssparkutils.fs.head(self.path, 256 * 1024 * 1024).splitlines():
+                    try:
+                        self._merge(json.loads(line))
+                    except ValueError:
+                        continue  # torn last line from a crash
+            unfinished = sum(1 for rec in self._entries.values() if rec.get("state") != "discovered")
+        if unfinished:
+            print(f"🔁 Resuming from run journal: {unfinished} file(s) with completed steps")
+        return unfinished
+
+    def resume_point(self, row):
+        """Returns the journal record for row if the same file version already got past discovery."""
+        key = self._key(row)
+        with self._lock:
+            self._seen.add(key)
+            rec = self._entries.get(key)
+        if rec and rec.get("state") != "discovered" and rec.get("etag") == row.etag:
+            return rec
+        return None
+
+    def mark(self, row, state: str = None, **fields):
+        rec = {"key": self._key(row), **fields}
+        if state:
+            rec["state"] = state
+        if state == "discovered":
+            # Enough to rebuild the row later; the download URL is short-lived, so it is not kept.
+            rec.update({k: v for k, v in row.as_dict().items() if k != "file_url"})
+        with self._lock:
+            self._seen.add(rec["key"])
+            self._merge(rec)
+            self._buffer.append(json.dumps(rec, default=str))
+            due = (len(self._buffer) >= self.flush_every
+                   or time.monotonic() - self._last_flush >= self.flush_interval_sec)
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:  # held across the append so lines land in order
+            lines, self._buffer = self._buffer, []
+            self._last_flush = time.monotonic()
+            if not lines:
+                return
+            try:
+                mssparkutils.fs.append(self.path, "\n".join(lines) + "\n", True)
+            except Exception as e:
+                print(f"⚠️ Failed to append {len(lines)} run journal line(s); those steps are redone after a crash: {e}")
+
+    def stranded(self) -> list:
+        """Records of files that landed but were not loaded and were not rediscovered this run."""
+        with self._lock:
+            stranded = [dict(rec) for key, rec in self._entries.items()
+                        if key not in self._seen and rec.get("lakehouse_path") and not rec.get("loaded")]
+            self._seen.update(rec["key"] for rec in stranded)  # kept by compact() until loaded
+        return stranded
+
+    def compact(self, finished):
+        """Rewrites the journal with only this run's unfinished files, or removes it when none are left."""
+        self.flush()
+        with self._lock:
+            keep = [rec for key, rec in self._entries.items() if key in self._seen and not finished(rec)]
+            self._entries = {rec["key"]: rec for rec in keep}
+            if keep:
+                mssparkutils.fs.put(self.path, "".join(json.dumps(rec, default=str) + "\n" for rec in keep), True)
+            elif mssparkutils.fs.exists(self.path):
+                mssparkutils.fs.rm(self.path)
+        return len(keep)
+
+
+class DiscoveredFile:
+    """One file found in SharePoint. Slots keep per-file overhead small on large listings."""
+
+    __slots__ = ("file_name", "folder_name", "source_folder", "site_name", "file_url", "size", "drive_id", "item_id",
+                 "etag", "ctag", "quick_xor_hash", "lakehouse_folder", "copy_to_archive", "delete_original",
+                 "parquet_compression", "keep_original")
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"DiscoveredFile({self.folder_name}/{self.file_name})"
+
+
 class FileDiscovery:
-    def __init__(self, sp: SharePointService, site_path: str, tz: str = "Asia/Kuala_Lumpur"):
+    ARCHIVE_SUBFOLDER = "archive"  # created by the orchestrator under each source folder; never ingested
+
+    def __init__(self, sp: SharePointService, site_path: str, tz: str = "Asia/Kuala_Lumpur",
+                 state_store: LakehouseStateStore = None, manifest: IngestManifest = None, max_workers: int = 8,
+                 drive_name: str = None):
         self.sp = sp
         self.site_path = site_path
+        self.drive_name = drive_name
         self.tz = tz
+        self.state_store = state_store
+        self.manifest = manifest
+        self.max_workers = max(1, int(max_workers))
+        self.pending_delta_links = {}
 
     def _log(self, msg: str):
         now = datetime.now(pytz.timezone(self.tz)).strftime("%Y-%m-%d %H:%M:%S")
         print(f"[{now}] {msg}")
 
-    def collect(self, drive_id: str, folder_list: list) -> pd.DataFrame:
+    # ------------- filters -------------
+    @staticmethod
+    def _patterns(value) -> list:
+        # Accepts a list or comma-separated string; bare extensions (".csv", "csv") become "*.csv".
+        if not value:
+            return []
+        items = value.split(",") if isinstance(value, str) else value
+        patterns = []
+        for p in (str(i).strip().lower() for i in items):
+            if not p:
+                continue
+            if not any(ch in p for ch in "*?["):
+                p = "*" + (p if p.startswith(".") else "." + p)
+            patterns.append(p)
+        return patterns
+
+    @staticmethod
+    def _wanted(name: str, include: list, exclude: list) -> bool:
+        name = name.lower()
+        if include and not any(fnmatch.fnmatchcase(name, p) for p in include):
+            return False
+        return not any(fnmatch.fnmatchcase(name, p) for p in exclude)
+
+    # ------------- full listing -------------
+    def _walk(self, drive_id: str, folder_name: str, max_depth: int, include: list, exclude: list):
+        """Lists folder_name and up to max_depth levels of subfolders, each level in parallel.
+
+        Yields (folder_path, item) for wanted files only, in breadth-first listing order.
+        A level with a single folder is streamed page by page.
+        """
+        level, depth = [folder_name], 0
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sp-discovery") as pool:
+            while level:
+                if len(level) == 1:
+                    listings = [(level[0], self.sp.iter_folder_children(drive_id, level[0]))]
+                else:
+                    listings = zip(level, pool.map(lambda f: self.sp.list_folder_children(drive_id, f), level))
+                next_level = []
+                for path, children in listings:
+                    for it in children:
+                        if "folder" in it:
+                            if depth < max_depth and it["name"] != self.ARCHIVE_SUBFOLDER:
+                                next_level.append(f"{path}/{it['name']}")
+                        elif "file" in it and self._wanted(it["name"], include, exclude):
+                            yield path, it
+                level, depth = next_level, depth + 1
+
+    # ------------- incremental (delta) listing -------------
+    def _delta_key(self, folder_name: str) -> str:
+        drive = f"_{self.drive_name}" if self.drive_name else ""
+        return f"delta_{self.site_path}{drive}_{folder_name}"
+
+    @staticmethod
+    def _subfolder_path(folders: dict, folder_id: str, folder_name: str, item_id: str):
+        # Resolves a folder id to (path, depth) relative to the source folder, or None if outside it.
+        names = []
+        while item_id != folder_id:
+            entry = folders.get(item_id)
+            if entry is None or len(names) > len(folders):
+                return None
+            item_id, name = entry
+            names.append(name)
+        return "/".join([folder_name] + names[::-1]), len(names)
+
+    def _delta_items(self, drive_id: str, folder_name: str, max_depth: int, include: list, exclude: list) -> list:
+        if self.state_store is None:
+            raise ValueError(f"Incremental discovery for '{folder_name}' requires a lakehouse state store.")
+        state = self.state_store.read_json(self._delta_key(folder_name), {}) or {}
+        folder_id = state.get("folder_id") or self.sp.get_item(drive_id, folder_name)["id"]
+        # Delta items carry no path, so the subfolder tree is kept as id -> [parent_id, name].
+        folders = dict(state.get("folders") or {})
+        changes, delta_link = self.sp.list_drive_delta(drive_id, state.get("delta_link"))
+
+        for it in changes:
+            if "deleted" in it:
+                folders.pop(it["id"], None)
+        # Parents are not guaranteed to precede children, so place folders until nothing moves.
+        pending = [it for it in changes if "folder" in it and "deleted" not in it and it["id"] != folder_id]
+        placed = True
+        while pending and placed:
+            placed, rest = False, []
+            for it in pending:
+                parent = it.get("parentReference", {}).get("id")
+                if (parent == folder_id or parent in folders) and it["name"] != self.ARCHIVE_SUBFOLDER:
+                    folders[it["id"]] = [parent, it["name"]]
+                    placed = True
+                else:
+                    rest.append(it)
+            pending = rest
+        for it in pending:  # moved out of the tree (or into an archive folder)
+            folders.pop(it["id"], None)
+
+        self.pending_delta_links[folder_name] = {"folder_id": folder_id, "delta_link": delta_link, "folders": folders}
+
+        found = []
+        for it in changes:
+            if "deleted" in it or "file" not in it or not self._wanted(it["name"], include, exclude):
+                continue
+            location = self._subfolder_path(folders, folder_id, folder_name, it.get("parentReference", {}).get("id"))
+            if location is None or location[1] > max_depth:
+                continue
+            if "@microsoft.graph.downloadUrl" not in it:
+                it["@microsoft.graph.downloadUrl"] = self.sp.get_download_url(drive_id, it["id"])
+            found.append((location[0], it))
+        return found
+
+    def commit_delta_links(self, skip_folders=()):
+        # Called after a run so a folder's token only advances once its files were handled;
+        # folders with failures keep their old token and see the same changes again next run.
+        for folder_name, state in self.pending_delta_links.items():
+            if folder_name not in skip_folders and state.get("delta_link"):
+                self.state_store.write_json(self._delta_key(folder_name), state)
+        self.pending_delta_links = {}
+
+    def iter_files(self, drive_id: str, folder_list: list):
+        """Yields a DiscoveredFile per wanted file as soon as its listing page arrives."""
         if not folder_list:
             raise ValueError("No folders specified in config.json under 'source_folder_list'.")
-        rows, total = [], 0
+        total = 0
         for folder_info in folder_list:
             folder_name = folder_info.get("folder_name")
             if not folder_name:
                 continue
-            copy_to_archive = folder_info.get("copy_to_archive", "False")
-            delete_original = folder_info.get("delete_original", "False")
+            copy_to_archive = str(folder_info.get("copy_to_archive", "False")).lower() == "true"
+            delete_original = str(folder_info.get("delete_original", "False")).lower() == "true"
             lakehouse_folder = folder_info.get("lakehouse_folder")
+            recursive = str(folder_info.get("recursive", "False")).lower() == "true"
+            max_depth = int(folder_info.get("max_depth", 10)) if recursive else 0
+            # CSV/Excel files are landed as Parquet with this codec when convert_to_parquet is on.
+            convert = str(folder_info.get("convert_to_parquet", "False")).lower() == "true"
+            parquet_compression = folder_info.get("parquet_compression", "snappy") if convert else None
+            keep_original = str(folder_info.get("keep_original", "False")).lower() == "true"
+            include = self._patterns(folder_info.get("include"))
+            exclude = self._patterns(folder_info.get("exclude"))
 
-            items = self.sp.list_folder_children(drive_id, folder_name)
-            count = 0
-            for it in items:
-                if "file" in it:
-                    rows.append({
-                        "file_name": it["name"],
-                        "folder_name": folder_name,
-                        "site_name": self.site_path,
-                        "file_url": it["@microsoft.graph.downloadUrl"],
-                        "lakehouse_folder": lakehouse_folder,
-                        "copy_to_archive": copy_to_archive,
-                        "delete_original": delete_original
-                    })
-                    count += 1; total += 1
-            self._log(f"Retrieved {count} files from '{folder_name}'.")
+            if str(folder_info.get("incremental", "False")).lower() == "true":
+                found = self._delta_items(drive_id, folder_name, max_depth, include, exclude)
+            else:
+                found = self._walk(drive_id, folder_name, max_depth, include, exclude)
+            count, unchanged = 0, 0
+            for folder_path, it in found:
+                if self.manifest is not None and self.manifest.is_unchanged(drive_id, it):
+                    unchanged += 1
+                    continue
+                count += 1; total += 1
+                yield DiscoveredFile(
+                    file_name=it["name"],
+                    folder_name=folder_path,
+                    source_folder=folder_name,
+                    site_name=self.site_path,
+                    file_url=it["@microsoft.graph.downloadUrl"],
+                    size=it.get("size"),
+                    drive_id=drive_id,
+                    item_id=it.get("id"),
+                    etag=it.get("eTag"),
+                    ctag=it.get("cTag"),
+                    quick_xor_hash=((it.get("file") or {}).get("hashes") or {}).get("quickXorHash"),
+                    lakehouse_folder=lakehouse_folder,
+                    copy_to_archive=copy_to_archive,
+                    delete_original=delete_original,
+                    parquet_compression=parquet_compression,
+                    keep_original=keep_original,
+                )
+            self._log(f"Retrieved {count} files from '{folder_name}'."
+                      + (f" Skipped {unchanged} unchanged." if unchanged else ""))
         print(f"Total files discovered: {total}")
-        return pd.DataFrame(rows)
+
+    @staticmethod
+    def to_dataframe(files: list):
+        import pandas as pd  # preview only; keeps pandas off the transfer path
+
+        return pd.DataFrame([f.as_dict() for f in files])
+
+    def collect(self, drive_id: str, folder_list: list):
+        """Materialises the full listing as a pandas DataFrame (for previews and ad-hoc use)."""
+        return self.to_dataframe(list(self.iter_files(drive_id, folder_list)))
 
 
 # In[14]:
 
 
+class StreamingUnavailable(RuntimeError):
+    """Raised when the OneLake DFS endpoint cannot be used and the temp-file path must be taken."""
+
+
+class DownloadUrlExpired(RuntimeError):
+    """Raised when a pre-authenticated download URL is rejected (401/403); a fresh one must be fetched."""
+
+
+class OneLakeFileWriter:
+    """Write-only file object over a OneLake DFS file: appends in chunk_size blocks, close() flushes."""
+
+    def __init__(self, lakehouse, dfs_url: str, headers: dict):
+        self.lakehouse = lakehouse
+        self.dfs_url = dfs_url
+        self.headers = headers
+        self.closed = False
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def tell(self) -> int:
+        return self._position + len(self._buffer)
+
+    def write(self, data) -> int:
+        self._buffer += data
+        if len(self._buffer) >= self.lakehouse.chunk_size:
+            self._append()
+        return len(data)
+
+    def _append(self):
+        if self._buffer:
+            self.lakehouse._dfs_append(self.dfs_url, self.headers, bytes(self._buffer), self._position)
+            self._position += len(self._buffer)
+            self._buffer = bytearray()
+
+    def flush(self):
+        pass  # blocks are appended as they fill; only close() commits the file
+
+    def close(self):
+        if not self.closed:
+            self._append()
+            self.lakehouse._dfs_flush(self.dfs_url, self.headers, self._position)
+            self.closed = True
+
+
+class ChunkStream(io.RawIOBase):
+    """Readable file object over an iterator of byte chunks (e.g. a download's iter_content)."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            self._pending = next(self._chunks, None)
+            if self._pending is None:
+                self._pending = b""
+                return 0
+        n = min(len(buffer), len(self._pending))
+        buffer[:n] = self._pending[:n]
+        self._pending = self._pending[n:]
+        return n
+
+
 class LakehouseService:
-    def __init__(self, lakehouse_root: str):
+    CONVERTIBLE = (".csv", ".xlsx", ".xls")  # formats that can be landed as Parquet
+
+    def __init__(self, lakehouse_root: str, streaming: bool = True, chunk_size: int = 8 * 1024 * 1024,
+                 range_threshold: int = 256 * 1024 * 1024, range_size: int = 64 * 1024 * 1024,
+                 max_resume_attempts: int = 3, timeout_sec: int = 120, transport: HttpTransport = None,
+                 dfs_endpoint: str = None, range_parallelism: int = 4):
         self.lakehouse_root = lakehouse_root
+        self.dfs_endpoint = dfs_endpoint  # overrides https://<onelake host> (e.g. a local stand-in)
+        self.streaming = streaming
+        self.chunk_size = chunk_size
+        self.range_threshold = range_threshold
+        self.range_size = range_size
+        self.max_resume_attempts = max_resume_attempts
+        self.range_parallelism = max(1, int(range_parallelism))  # ranges of one large file fetched/appended at once
+        self.timeout_sec = timeout_sec
+        self.transport = transport or HttpTransport(timeout_sec=timeout_sec)
 
+    # ------------- temp-file path -------------
     def download_to_local(self, file_url: str, file_name: str, local_dir: str = "/tmp") -> str:
         os.makedirs(local_dir, exist_ok=True)
         local_path = os.path.join(local_dir, file_name)
-        resp = requests.get(file_url)
-        if resp.status_code != 200:
-            raise RuntimeError(f"Failed to download '{file_name}'. Status: {resp.status_code}")
-        with open(local_path, "wb") as f:
-            f.write(resp.content)
+        try:
+            with self.transport.request("GET", file_url, stream=True, timeout=self.timeout_sec) as resp:
+                if resp.status_code in (401, 403):
+                    raise DownloadUrlExpired(f"Download URL for '{file_name}' rejected. Status: {resp.status_code}")
+                if resp.status_code != 200:
+                    raise RuntimeError(f"Failed to download '{file_name}'. Status: {resp.status_code}")
+                with open(local_path, "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=self.chunk_size):
+                        f.write(chunk)
+        except Exception:
+            self._remove_local(local_path)  # don't leave partial downloads on the driver disk
+            raise
         return local_path
 
+    @staticmethod
+    def _remove_local(local_path: str):
+        try:
+            os.remove(local_path)
+        except OSError:
+            pass
+
     def upload(self, local_path: str, lakehouse_folder: str, file_name: str) -> str:
         lakehouse_path = f"{self.lakehouse_root}/Files/{lakehouse_folder}/{file_name}"
         mssparkutils.fs.cp(f"file://{local_path}", lakehouse_path)
         return lakehouse_path
 
+    # ------------- streaming path (OneLake DFS) -------------
+    def _dfs_url(self, lakehouse_folder: str, file_name: str) -> str:
+        # abfss://<workspace>@onelake.dfs.fabric.microsoft.com/<lakehouse>  ->  https://onelake.dfs.fabric.microsoft.com/<workspace>/<lakehouse>
+        if not self.lakehouse_root.startswith("abfss://") or "@" not in self.lakehouse_root:
+            raise StreamingUnavailable(f"Unsupported lakehouse root for streaming: {self.lakehouse_root}")
+        host = self.lakehouse_root[len("abfss://"):].split("@", 1)[1].partition("/")[0]
+        endpoint = (self.dfs_endpoint or f"https://{host}").rstrip("/")
+        return f"{endpoint}{self._dfs_path(lakehouse_folder, file_name)}"
+
+    def _dfs_path(self, lakehouse_folder: str, file_name: str) -> str:
+        # /<workspace>/<lakehouse>/Files/<folder>/<name>: the filesystem-relative form used by rename
+        container, rest = self.lakehouse_root[len("abfss://"):].split("@", 1)
+        item_path = rest.partition("/")[2]
+        return f"/{container}/{item_path}/Files/{lakehouse_folder}/{file_name}"
+
+    @staticmethod
+    def _staging_name(file_name: str) -> str:
+        # Leading underscore: Spark and the bronze loader skip the file while it is being written.
+        return f"_{file_name}.{uuid.uuid4().hex[:8]}.inprogress"
+
+    def _storage_headers(self) -> dict:
+        try:
+            token = mssparkutils.credentials.getToken("storage")
+        except Exception as e:
+            raise StreamingUnavailable(f"Could not acquire OneLake storage token: {e}")
+        return {"Authorization": f"Bearer {token}", "x-ms-version": "2023-11-03"}
+
+    def _dfs_create(self, dfs_url: str, headers: dict):
+        resp = self.transport.request("PUT", f"{dfs_url}?resource=file", headers=headers, timeout=self.timeout_sec)
+        if resp.status_code not in (200, 201):
+            raise StreamingUnavailable(f"Failed to create '{dfs_url}'. Status: {resp.status_code} | {resp.text}")
+
+    def _dfs_append(self, dfs_url: str, headers: dict, data: bytes, position: int):
+        # Appending the same bytes at the same position again is harmless, so retries are safe.
+        resp = self.transport.request("PATCH", f"{dfs_url}?action=append&position={position}", data=data,
+                                      headers={**headers, "Content-Type": "application/octet-stream"},
+                                      timeout=self.timeout_sec, idempotent=True)
+        if resp.status_code != 202:
+            raise RuntimeError(f"Failed to append at {position}. Status: {resp.status_code} | {resp.text}")
+
+    def _dfs_rename(self, lakehouse_folder: str, source_name: str, target_name: str, headers: dict):
+        # Replaces the target in one step, so readers see either the old file or the complete new one.
+        resp = self.transport.request("PUT", self._dfs_url(lakehouse_folder, target_name),
+                                      headers={**headers, "x-ms-rename-source": quote(self._dfs_path(lakehouse_folder, source_name))},
+                                      timeout=self.timeout_sec, idempotent=False)  # a repeat would find no source
+        if resp.status_code not in (200, 201):
+            raise RuntimeError(f"Failed to move '{source_name}' to '{target_name}'. Status: {resp.status_code} | {resp.text}")
+
+    def _dfs_delete(self, dfs_url: str, headers: dict):
+        # Best effort: removes a partly written staging file after a failed transfer.
+        try:
+            self.transport.request("DELETE", dfs_url, headers=headers, timeout=self.timeout_sec)
+        except requests.RequestException as e:
+            print(f"⚠️ Could not remove staging file '{dfs_url}': {e}")
+
+    def _dfs_flush(self, dfs_url: str, headers: dict, position: int):
+        resp = self.transport.request("PATCH", f"{dfs_url}?action=flush&position={position}", headers=headers,
+                                      timeout=self.timeout_sec, idempotent=True)
+        if resp.status_code != 200:
+            raise RuntimeError(f"Failed to flush at {position}. Status: {resp.status_code} | {resp.text}")
+
+    def _pipe_range(self, file_url: str, dfs_url: str, headers: dict, position: int, end: int = None,
+                    progress: list = None) -> int:
+        # Streams [position, end] (or to EOF) into the DFS file; returns the new write position.
+        # At most one chunk is held in memory at a time. progress[0] tracks the position as chunks land.
+        req_headers = {}
+        if position or end is not None:
+            req_headers["Range"] = f"bytes={position}-{'' if end is None else end}"
+        with self.transport.request("GET", file_url, headers=req_headers, stream=True, timeout=self.timeout_sec) as resp:
+            if resp.status_code in (401, 403):
+                raise DownloadUrlExpired(f"Download URL rejected. Status: {resp.status_code}")
+            if resp.status_code not in (200, 206):
+                raise RuntimeError(f"Download failed. Status: {resp.status_code}")
+            if position and resp.status_code == 200:
+                raise RuntimeError("Server ignored Range header; cannot resume")
+            for chunk in resp.iter_content(chunk_size=self.chunk_size):
+                if chunk:
+                    self._dfs_append(dfs_url, headers, chunk, position)
+                    position += len(chunk)
+                    if progress is not None:
+                        progress[0] = position
+        return position
+
+    def _pipe_resumable(self, file_url: str, dfs_url: str, headers: dict, file_name: str, start: int = 0,
+                        end: int = None) -> int:
+        # _pipe_range, resumed from the last appended byte when the download drops.
+        progress, attempts = [start], 0
+        while True:
+            try:
+                return self._pipe_range(file_url, dfs_url, headers, progress[0], end, progress=progress)
+            except requests.RequestException as e:
+                position = progress[0]
+                attempts += 1
+                if attempts > self.max_resume_attempts:
+                    raise RuntimeError(f"Download of '{file_name}' failed after {attempts} attempts at byte {position}: {e}")
+                print(f"↻ Resuming '{file_name}' from byte {position} (attempt {attempts}): {e}")
+
+    def _pipe_range_counted(self, *args) -> dict:
+        # _pipe_resumable on a range thread; returns that range's retry/throttle counts.
+        self.transport.thread_stats(reset=True)
+        self._pipe_resumable(*args)
+        return self.transport.thread_stats()
+
+    def stream_to_lakehouse(self, file_url: str, lakehouse_folder: str, file_name: str, size: int = None,
+                            stats: dict = None) -> str:
+        # Bytes go to a staging file that is renamed over the target only after the final flush,
+        # so a failed download never replaces an earlier good copy.
+        staging_name = self._staging_name(file_name)
+        staging_url = self._dfs_url(lakehouse_folder, staging_name)
+        headers = self._storage_headers()
+        self._dfs_create(staging_url, headers)
+        try:
+            if bool(size) and size >= self.range_threshold:
+                # Large files: byte ranges are downloaded and appended at their own offsets in parallel
+                # (DFS accepts appends at any position); the single flush at the end commits them in order.
+                ranges = [(start, min(start + self.range_size, size) - 1) for start in range(0, size, self.range_size)]
+                with ThreadPoolExecutor(max_workers=min(self.range_parallelism, len(ranges)),
+                                        thread_name_prefix="dfs-range") as pool:
+                    futures = [pool.submit(self._pipe_range_counted, file_url, staging_url, headers, file_name, start, end)
+                               for start, end in ranges]
+                    for future in futures:
+                        counts = future.result()
+                        if stats is not None:
+                            # retries/throttle waits on range threads, added to the worker's own counts
+                            for k, v in counts.items():
+                                stats[k] = stats.get(k, 0) + v
+                position = size
+            else:
+                position = self._pipe_resumable(file_url, staging_url, headers, file_name)
+
+            self._dfs_flush(staging_url, headers, position)
+            self._dfs_rename(lakehouse_folder, staging_name, file_name, headers)
+        except Exception:
+            self._dfs_delete(staging_url, headers)
+            raise
+        if stats is not None:
+            stats["bytes"] = position
+        return f"{self.lakehouse_root}/Files/{lakehouse_folder}/{file_name}"
+
+    # ------------- Parquet conversion on landing -------------
+    def _open_sink(self, lakehouse_folder: str, file_name: str, local_dir: str):
+        """Returns (file object, finish, abort) for writing a new lakehouse file.
+
+        finish() commits the file and returns its path; abort() discards what was written.
+        Nothing appears at the target path until finish().
+        """
+        lakehouse_path = f"{self.lakehouse_root}/Files/{lakehouse_folder}/{file_name}"
+        if self.streaming:
+            try:
+                staging_name = self._staging_name(file_name)
+                staging_url = self._dfs_url(lakehouse_folder, staging_name)
+                headers = self._storage_headers()
+                self._dfs_create(staging_url, headers)
+                writer = OneLakeFileWriter(self, staging_url, headers)
+
+                def finish():
+                    try:
+                        writer.close()
+                        self._dfs_rename(lakehouse_folder, staging_name, file_name, headers)
+                    except Exception:
+                        self._dfs_delete(staging_url, headers)
+                        raise
+                    return lakehouse_path
+
+                def abort():
+                    self._dfs_delete(staging_url, headers)
+                return writer, finish, abort
+            except StreamingUnavailable as e:
+                print(f"ℹ️ Streaming unavailable for '{file_name}', using temp file: {e}")
+        os.makedirs(local_dir, exist_ok=True)
+        local_path = os.path.join(local_dir, file_name)
+        f = open(local_path, "wb")
+
+        def finish():
+            f.close()
+            try:
+                return self.upload(local_path, lakehouse_folder, file_name)
+            finally:
+                self._remove_local(local_path)
+
+        def abort():
+            f.close()
+            self._remove_local(local_path)
+        return f, finish, abort
+
+    def _csv_to_parquet(self, chunks, sink, compression: str) -> int:
+        import csv
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+
+        # Every column is kept as a string, matching how raw CSVs are loaded into bronze.
+        stream = io.BufferedReader(ChunkStream(chunks), buffer_size=self.chunk_size)
+        names = next(csv.reader([stream.readline().decode("utf-8-sig")]), [])
+        if not names:
+            raise RuntimeError("CSV has no header row")
+        schema = pa.schema([(n, pa.string()) for n in names])
+        try:
+            reader = pa_csv.open_csv(
+                stream,
+                read_options=pa_csv.ReadOptions(column_names=names, block_size=self.chunk_size),
+                convert_options=pa_csv.ConvertOptions(column_types={n: pa.string() for n in names}, strings_can_be_null=True),
+            )
+        except pa.ArrowInvalid as e:
+            if "Empty CSV" not in str(e):
+                raise
+            # Header only (a "no data today" extract): land an empty table with the header's columns.
+            pq.write_table(schema.empty_table(), sink, compression=compression)
+            return 0
+        rows = 0
+        with pq.ParquetWriter(sink, reader.schema, compression=compression) as writer:
+            for batch in reader:
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        return rows
+
+    @staticmethod
+    def _excel_to_parquet(content: bytes, sink, compression: str) -> int:
+        import pandas as pd
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Workbooks need random access, so the (first) sheet is read from memory rather than streamed.
+        pdf = pd.read_excel(io.BytesIO(content), dtype=str)
+        pdf.columns = [str(c) for c in pdf.columns]
+        table = pa.Table.from_pandas(pdf.where(pdf.notna(), None), preserve_index=False)
+        pq.write_table(table, sink, compression=compression)
+        return table.num_rows
+
+    @staticmethod
+    def _tee(chunks, sink):
+        # Passes chunks through while also writing each one to sink.
+        for chunk in chunks:
+            sink.write(chunk)
+            yield chunk
+
+    def convert_to_parquet(self, file_url: str, lakehouse_folder: str, file_name: str, compression: str = "snappy",
+                           local_dir: str = "/tmp", keep_original: bool = False) -> str:
+        """Lands a CSV or Excel file as <name>.parquet, converting while it downloads.
+
+        With keep_original, the downloaded bytes are also written to the original file name in
+        the same pass, so the file is only downloaded once.
+        """
+        ext = os.path.splitext(file_name)[1].lower()
+        target_name = f"{os.path.splitext(file_name)[0]}.parquet"
+        with self.transport.request("GET", file_url, stream=True, timeout=self.timeout_sec) as resp:
+            if resp.status_code in (401, 403):
+                raise DownloadUrlExpired(f"Download URL for '{file_name}' rejected. Status: {resp.status_code}")
+            if resp.status_code != 200:
+                raise RuntimeError(f"Failed to download '{file_name}'. Status: {resp.status_code}")
+            sink, finish, abort = self._open_sink(lakehouse_folder, target_name, local_dir)
+            original = None
+            try:
+                chunks = resp.iter_content(chunk_size=self.chunk_size)
+                if keep_original:
+                    original = self._open_sink(lakehouse_folder, file_name, local_dir)
+                    chunks = self._tee(chunks, original[0])
+                if ext == ".csv":
+                    rows = self._csv_to_parquet(chunks, sink, compression)
+                else:
+                    rows = self._excel_to_parquet(b"".join(chunks), sink, compression)
+                for _ in chunks:
+                    pass  # anything the converter left unread still belongs in the original
+            except Exception as e:
+                abort()  # never leave a partial or empty .parquet behind for readers of the folder
+                if original is not None:
+                    original[2]()
+                raise RuntimeError(f"Parquet conversion of '{file_name}' failed: {e}")
+        if original is not None:
+            try:
+                original[1]()
+            except Exception:
+                abort()
+                raise
+        path = finish()
+        print(f"🗜️ Converted '{file_name}' to Parquet ({compression}, {rows} rows)")
+        return path
+
+    _pyarrow_available = None
+
+    def _can_convert(self, file_name: str) -> bool:
+        if os.path.splitext(file_name)[1].lower() not in self.CONVERTIBLE:
+            return False
+        if LakehouseService._pyarrow_available is None:
+            try:
+                import pyarrow  # noqa: F401
+                LakehouseService._pyarrow_available = True
+            except ImportError:
+                print("ℹ️ pyarrow is not installed; files are landed without Parquet conversion")
+                LakehouseService._pyarrow_available = False
+        return LakehouseService._pyarrow_available
+
+    def transfer(self, file_url: str, lakehouse_folder: str, file_name: str, size: int = None,
+                 local_dir: str = "/tmp", stats: dict = None, parquet_compression: str = None,
+                 keep_original: bool = False) -> str:
+        """Lands one file; if given, stats is filled with mode, bytes and per-phase seconds.
+
+        With parquet_compression set, CSV/Excel files land as Parquet with that codec (and the
+        original alongside when keep_original is set); the Parquet path is returned.
+        """
+        stats = {} if stats is None else stats
+        if parquet_compression and self._can_convert(file_name):
+            started = time.monotonic()
+            path = self.convert_to_parquet(file_url, lakehouse_folder, file_name, parquet_compression, local_dir,
+                                           keep_original=keep_original)
+            stats.update(mode="parquet", bytes=size, stream_sec=time.monotonic() - started)
+            return path
+        return self._land(file_url, lakehouse_folder, file_name, size, local_dir, stats)
+
+    def _land(self, file_url: str, lakehouse_folder: str, file_name: str, size: int, local_dir: str,
+              stats: dict) -> str:
+        # Copies the file byte for byte: streamed to OneLake, or staged in local_dir as a fallback.
+        if self.streaming:
+            try:
+                started = time.monotonic()
+                path = self.stream_to_lakehouse(file_url, lakehouse_folder, file_name, size, stats=stats)
+                stats.update(mode="stream", stream_sec=time.monotonic() - started)
+                return path
+            except StreamingUnavailable as e:
+                print(f"ℹ️ Streaming unavailable for '{file_name}', using temp file: {e}")
+        started = time.monotonic()
+        local_path = self.download_to_local(file_url, file_name, local_dir=local_dir)
+        try:
+            downloaded = time.monotonic()
+            path = self.upload(local_path, lakehouse_folder, file_name)
+            stats.update(mode="temp_file", bytes=os.path.getsize(local_path),
+                         download_sec=downloaded - started, upload_sec=time.monotonic() - downloaded)
+        finally:
+            self._remove_local(local_path)  # the staged copy is only needed until it is uploaded
+        return path
+
+
+class BronzeDeltaLoader:
+    """Appends landed files to the bronze sink_table configured for their lakehouse folder."""
+
+    _INVALID_COLUMN_CHARS = re.compile(r"[ ,;{}()\n\t=]+")
+
+    def __init__(self, spark, lakehouse_root: str, bronze_cfg: dict, tz: str = "Asia/Kuala_Lumpur",
+                 partition_column: str = "_ingest_date"):
+        self.spark = spark
+        self.lakehouse_root = lakehouse_root
+        self.bronze_cfg = bronze_cfg
+        self.tz = tz
+        self.partition_column = partition_column
+
+    def sink_path(self, lakehouse_folder: str):
+        sink_table = (self.bronze_cfg.get(lakehouse_folder) or {}).get("sink_table")
+        if not sink_table:
+            return None
+        return f"{self.lakehouse_root}/{sink_table.lstrip('/')}"
+
+    def _clean_columns(self, df):
+        # Delta rejects spaces and a few punctuation characters in column names without column mapping.
+        return df.toDF(*[self._INVALID_COLUMN_CHARS.sub("_", c).strip("_") or f"col_{i}" for i, c in enumerate(df.columns)])
+
+    def _read(self, paths: list):
+        from pyspark.sql import functions as F
+        from pyspark.sql.types import StringType, StructField, StructType
+
+        by_ext = {}
+        for path in paths:
+            by_ext.setdefault(os.path.splitext(path)[1].lower(), []).append(path)
+
+        frames = []
+        # One read per CSV: a multi-file read takes the first header and maps the rest by position.
+        for path in by_ext.pop(".csv", []):
+            df = self.spark.read.option("header", True).csv(path)
+            frames.append(self._clean_columns(df).withColumn("_source_file", F.lit(os.path.basename(path))))
+        if by_ext.get(".parquet"):
+            df = self.spark.read.parquet(*by_ext.pop(".parquet"))
+            # _metadata.file_name is the decoded name, matching the other formats (input_file_name() is URL-encoded).
+            frames.append(self._clean_columns(df.withColumn("_source_file", F.col("_metadata.file_name"))))
+        for ext in (".xlsx", ".xls"):
+            for path in by_ext.pop(ext, []):
+                import pandas as pd  # only needed for Excel sources
+
+                pdf = pd.read_excel(path, dtype=str)
+                pdf.columns = [str(c) for c in pdf.columns]
+                # Explicit all-string schema: inference fails on columns that are entirely empty.
+                schema = StructType([StructField(c, StringType(), True) for c in pdf.columns])
+                df = self.spark.createDataFrame(pdf.astype(object).where(pdf.notna(), None).values.tolist(), schema)
+                frames.append(self._clean_columns(df).withColumn("_source_file", F.lit(os.path.basename(path))))
+        for ext, skipped in by_ext.items():
+            print(f"ℹ️ Not loading {len(skipped)} '{ext or '(no extension)'}' file(s) into Delta: unsupported format")
+
+        if not frames:
+            return None
+        result = frames[0]
+        for df in frames[1:]:
+            result = result.unionByName(df, allowMissingColumns=True)
+        return result
+
+    def load(self, lakehouse_folder: str, paths: list) -> int:
+        """Reads all landed files of one folder and appends them to its sink_table in a single write."""
+        from delta.tables import DeltaTable
+        from pyspark.sql import functions as F
+
+        target = self.sink_path(lakehouse_folder)
+        if not target or not paths:
+            return 0
+        df = self._read(paths)
+        if df is None:
+            return 0
+
+        ingest_ts = datetime.now(pytz.timezone(self.tz)).replace(tzinfo=None)
+        df = (df.withColumn("_ingest_timestamp", F.lit(ingest_ts).cast("timestamp"))
+                .withColumn(self.partition_column, F.to_date(F.col("_ingest_timestamp"))))
+        writer = df.write.format("delta").mode("append").option("mergeSchema", "true")
+        if not DeltaTable.isDeltaTable(self.spark, target):
+            # Partition only new tables: Delta rejects appends whose partitioning differs from an
+            # existing table's, e.g. bronze tables created by hand without _ingest_date.
+            writer = writer.partitionBy(self.partition_column)
+        writer.save(target)
+        print(f"🧱 Appended {len(paths)} file(s) from '{lakehouse_folder}' to Delta: {target}")
+        return len(paths)
+
+
+class CopyMonitor:
+    """Tracks Graph async copy operations and fires a callback once each copy is confirmed.
+
+    Copies are registered with track() and polled in the background, many at a time,
+    so callers never block on a single copy. A copy that fails or does not finish
+    within timeout_sec triggers on_failed instead, so its dependent delete never runs.
+    """
+
+    DONE, FAILED, RUNNING = "completed", "failed", "inProgress"
+
+    def __init__(self, transport: HttpTransport, max_workers: int = 8, poll_interval_sec: float = 2.0,
+                 timeout_sec: int = 900):
+        self.transport = transport
+        self.max_workers = max_workers
+        self.poll_interval_sec = poll_interval_sec
+        self.timeout_sec = timeout_sec
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def track(self, monitor_url: str, on_complete, on_failed):
+        if not monitor_url:  # copy finished synchronously (200/201)
+            on_complete()
+            return
+        with self._cond:
+            self._pending.append((monitor_url, on_complete, on_failed, time.monotonic()))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="sp-copy-monitor", daemon=True)
+                self._thread.start()
+
+    def _status(self, monitor_url: str) -> str:
+        # Monitor URLs are pre-authenticated. Once the copy is done Graph may answer with a
+        # redirect to the new item, which we must not follow (it needs a bearer token).
+        resp = self.transport.request("GET", monitor_url, allow_redirects=False)
+        if resp.status_code in (301, 302, 303):
+            return self.DONE
+        if resp.status_code not in (200, 202):
+            return self.FAILED if resp.status_code == 404 else self.RUNNING
+        status = resp.json().get("status", self.RUNNING)
+        return status if status in (self.DONE, self.FAILED) else self.RUNNING
+
+    def _check(self, entry):
+        monitor_url, on_complete, on_failed, started = entry
+        try:
+            status = self._status(monitor_url)
+        except Exception as e:
+            status, error = self.RUNNING, e
+        else:
+            error = None
+        if status == self.DONE:
+            on_complete()
+            return True
+        if status == self.FAILED:
+            on_failed("copy operation failed")
+            return True
+        if time.monotonic() - started > self.timeout_sec:
+            on_failed(f"copy not confirmed within {self.timeout_sec}s" + (f" (last error: {error})" if error else ""))
+            return True
+        return False
+
+    def _loop(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sp-copy-poll") as pool:
+            while True:
+                with self._cond:
+                    batch, self._pending = self._pending, []
+                if batch:
+                    finished = list(pool.map(self._check, batch))
+                    still_running = [e for e, done in zip(batch, finished) if not done]
+                else:
+                    still_running = []
+                with self._cond:
+                    self._pending = still_running + self._pending
+                    if not self._pending:
+                        self._thread = None
+                        self._cond.notify_all()
+                        return
+                time.sleep(self.poll_interval_sec)
+
+    def wait(self):
+        """Blocks until every tracked copy has been confirmed or has failed."""
+        with self._cond:
+            while self._pending or self._thread is not None:
+                self._cond.wait(timeout=self.poll_interval_sec)
+
+
+class RunMetrics:
+    """Structured per-file / per-phase timings for one run.
+
+    Each file gets one record (bytes, phase durations, retries, throttle waits, outcomes).
+    Records can be appended to a Delta table and are summarised with throughput at the end.
+    With a transport, the summary's retries and throttle wait are that transport's totals for the
+    run, which also cover calls no single file owns (discovery, copy polling, batches).
+    """
+
+    SCHEMA = ("run_id string, site_name string, source_folder string, folder_name string, file_name string, "
+              "item_id string, bytes long, transfer_mode string, download_sec double, upload_sec double, "
+              "stream_sec double, archive_sec double, copy_confirm_sec double, delete_sec double, "
+              "retries int, throttle_wait_sec double, outcome string, archive_outcome string, error string, "
+              "recorded_at timestamp")
+    COLUMNS = [c.strip().split(" ")[0] for c in SCHEMA.split(",")]
+    PHASES = ["download_sec", "upload_sec", "stream_sec", "archive_sec", "copy_confirm_sec", "delete_sec"]
+
+    def __init__(self, tz: str = "Asia/Kuala_Lumpur", run_id: str = None, transport: HttpTransport = None):
+        self.tz = tz
+        self.transport = transport
+        self._transport_base = (transport.total_retries, transport.total_throttle_wait_sec) if transport else (0, 0.0)
+        now = datetime.now(pytz.timezone(tz))
+        self.run_id = run_id or f"{now.strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        self.started = time.monotonic()
+        self.run_phases = {}  # run-level phases such as discovery and delta load
+        self._files = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(row):
+        return (row.drive_id, row.item_id or f"{row.folder_name}/{row.file_name}")
+
+    def add(self, row, **fields):
+        """Merges fields into the file's record; *_sec, retries and throttle waits accumulate."""
+        with self._lock:
+            rec = self._files.get(self._key(row))
+            if rec is None:
+                rec = self._files[self._key(row)] = {
+                    "run_id": self.run_id, "site_name": row.site_name, "source_folder": row.source_folder,
+                    "folder_name": row.folder_name, "file_name": row.file_name, "item_id": row.item_id,
+                }
+            for k, v in fields.items():
+                if v is not None and (k.endswith("_sec") or k == "retries"):
+                    rec[k] = (rec.get(k) or 0) + v
+                else:
+                    rec[k] = v
+            rec["recorded_at"] = datetime.now(pytz.timezone(self.tz)).replace(tzinfo=None)
+
+    def add_run_phase(self, phase: str, seconds: float):
+        with self._lock:
+            self.run_phases[phase] = self.run_phases.get(phase, 0.0) + seconds
+
+    def records(self) -> list:
+        with self._lock:
+            return [dict(r) for r in self._files.values()]
+
+    def summary(self) -> dict:
+        records = self.records()
+        landed = [r for r in records if r.get("outcome") == "landed"]
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        total_bytes = sum(r.get("bytes") or 0 for r in landed)
+        return {
+            "run_id": self.run_id,
+            "elapsed_sec": elapsed,
+            "files_landed": len(landed),
+            "files_failed": sum(1 for r in records if r.get("outcome") == "failed"),
+            "archive_failed": sum(1 for r in records if r.get("archive_outcome") == "failed"),
+            "bytes": total_bytes,
+            "mb_per_sec": total_bytes / (1024 * 1024) / elapsed,
+            "files_per_sec": len(landed) / elapsed,
+            "retries": self._run_total("retries", records),
+            "throttle_wait_sec": self._run_total("throttle_wait_sec", records),
+            "phase_sec": {**{p: sum(r.get(p) or 0 for r in records) for p in self.PHASES}, **self.run_phases},
+        }
+
+    def _run_total(self, field: str, records: list):
+        if self.transport is None:
+            return sum(r.get(field) or 0 for r in records)
+        if field == "retries":
+            return self.transport.total_retries - self._transport_base[0]
+        return self.transport.total_throttle_wait_sec - self._transport_base[1]
+
+    def print_summary(self):
+        s = self.summary()
+        print(f"📊 Run {s['run_id']}: {s['files_landed']} landed, {s['files_failed']} failed, "
+              f"{s['archive_failed']} archive failures in {s['elapsed_sec']:.1f}s")
+        print(f"📊 Throughput: {s['bytes'] / (1024 * 1024):.1f} MB at {s['mb_per_sec']:.2f} MB/s, "
+              f"{s['files_per_sec']:.2f} files/s | retries: {s['retries']}, throttle wait: {s['throttle_wait_sec']:.1f}s")
+        phases = ", ".join(f"{p.replace('_sec', '')} {v:.1f}s" for p, v in s["phase_sec"].items() if v)
+        if phases:
+            print(f"📊 Time by phase (summed over files): {phases}")
+
+    def write(self, spark, table_path: str) -> int:
+        records = self.records()
+        if not records:
+            return 0
+        df = spark.createDataFrame([[r.get(c) for c in self.COLUMNS] for r in records], self.SCHEMA)
+        df.write.format("delta").mode("append").option("mergeSchema", "true").save(table_path)
+        return len(records)
+
 
 # In[15]:
 
 
 class SharePointToLakehouseOrchestrator:
-    def __init__(self, sp: SharePointService, discovery: FileDiscovery, lakehouse: LakehouseService, tz: str = "Asia/Kuala_Lumpur"):
+    def __init__(self, sp: SharePointService, discovery: FileDiscovery, lakehouse: LakehouseService,
+                 tz: str = "Asia/Kuala_Lumpur", max_workers: int = 8, loader: BronzeDeltaLoader = None,
+                 manifest: IngestManifest = None, batch_archive: bool = False, site_slots: threading.Semaphore = None,
+                 metrics: RunMetrics = None, preview: bool = False, journal: RunJournal = None):
         self.sp = sp
         self.discovery = discovery
         self.lakehouse = lakehouse
         self.tz = tz
+        self.max_workers = max(1, int(max_workers))
+        self.loader = loader
+        self.manifest = manifest
+        self.batch_archive = batch_archive
+        # Caps this site's in-flight transfers when several sources share one pool (fair scheduling).
+        self.site_slots = site_slots
+        # A shared RunMetrics is summarised by its owner; otherwise each run reports its own.
+        self.metrics = metrics
+        self._owns_metrics = metrics is None
+        self.preview = preview  # display the discovered files as a DataFrame before transferring
+        self.journal = journal  # resumes interrupted runs when set
+        self.copy_monitor = CopyMonitor(sp.transport, max_workers=self.max_workers)
+        self._delete_queue = []
+        self._delete_lock = threading.Lock()
+        self._cleanup_failed = set()  # files whose archive/delete failed this run
 
     def _timestamped(self, base_name: str) -> str:
         ts = datetime.now(pytz.timezone(self.tz)).strftime("%d%m%y%H%M%S")
         return f"{ts}_{base_name}"
 
-    def run(self, source_folder_list: list):
-        print(f"Processing files from SharePoint Site: {self.discovery.site_path}")
+    @staticmethod
+    def _landing_folder(row) -> str:
+        # Keeps the subfolder path below source_folder, so same-named files from different
+        # subfolders (e.g. dated drops) land side by side instead of overwriting each other.
+        subpath = row.folder_name[len(row.source_folder):].strip("/") if row.folder_name.startswith(row.source_folder) else ""
+        return f"{row.lakehouse_folder}/{subpath}" if subpath else row.lakehouse_folder
 
-        site_id = self.sp.get_site_id()
-        drive_id = self.sp.get_document_drive_id(site_id)
+    def _transfer(self, row) -> str:
+        # download + upload only; runs on a worker thread
+        safe_name = row.file_name.replace("'", "_")
+        landing_folder = self._landing_folder(row)
+        local_dir = os.path.join("/tmp", landing_folder or "")
+        self.sp.transport.thread_stats(reset=True)
+        stats = {}
 
-        df_files = self.discovery.collect(drive_id, source_folder_list)
-        if df_files.empty:
-            print("No files found. Process completed.")
+        def land():
+            return self.lakehouse.transfer(row.file_url, landing_folder, safe_name,
+                                           size=row.size, local_dir=local_dir, stats=stats,
+                                           parquet_compression=row.parquet_compression,
+                                           keep_original=bool(row.keep_original))
+        try:
+            try:
+                path = land()
+            except DownloadUrlExpired as e:
+                # Download URLs captured at discovery expire after about an hour; on long runs
+                # later files need a fresh one.
+                print(f"🔑 {e}; fetching a fresh download URL for '{row.file_name}'")
+                row.file_url = self.sp.get_download_url(row.drive_id, row.item_id)
+                path = land()
+        except Exception as e:
+            self.metrics.add(row, outcome="failed", error=str(e)[:1000], **self._request_counts(stats))
+            raise
+        self.metrics.add(row, outcome="landed", bytes=stats.get("bytes"), transfer_mode=stats.get("mode"),
+                         download_sec=stats.get("download_sec"), upload_sec=stats.get("upload_sec"),
+                         stream_sec=stats.get("stream_sec"), **self._request_counts(stats))
+        return path
+
+    def _request_counts(self, stats: dict = None) -> dict:
+        # This thread's retries/throttle waits, plus any that stats collected from helper threads.
+        counts = self.sp.transport.thread_stats()
+        return {k: v + (stats or {}).get(k, 0) for k, v in counts.items()}
+
+    def _archive_failed(self, row, **fields):
+        # Also keeps the file out of the manifest, so its archive/delete is retried next run.
+        with self._delete_lock:
+            self._cleanup_failed.add(RunMetrics._key(row))
+        self.metrics.add(row, archive_outcome="failed", **fields)
+
+    def _archive(self, drive_id: str, row):
+        original_file_name = row.file_name
+        safe_name = original_file_name.replace("'", "_")
+        folder_name = row.folder_name
+        archive_folder_path = f"{folder_name}/archive"
+        started = time.monotonic()
+        self.sp.transport.thread_stats(reset=True)
+        try:
+            self.sp.ensure_archive_folder(drive_id, archive_folder_path)
+            archive_file_name = self._timestamped(safe_name)
+            status, monitor_url = self.sp.copy_to_archive(drive_id, folder_name, original_file_name,
+                                                          archive_folder_path, archive_file_name)
+            print(f"📦 Copy to archive started: /{archive_folder_path}/{archive_file_name}")
+            if self.journal is not None:
+                self.journal.mark(row, "archived", archive_file_name=archive_file_name)
+        except Exception as e:
+            print(f"⚠️ Archive/Cleanup failed for '{original_file_name}': {e}")
+            self._archive_failed(row, archive_sec=time.monotonic() - started, error=str(e)[:1000],
+                                 **self._request_counts())
+            return
+        self.metrics.add(row, archive_sec=time.monotonic() - started, archive_outcome="copied", **self._request_counts())
+        self._after_copy(drive_id, row, status, monitor_url)
+
+    def _after_copy(self, drive_id: str, row, status: int, monitor_url: str):
+        # The original is only deleted once the monitor confirms the archive copy exists.
+        if not row.delete_original:
+            return
+        tracked = time.monotonic()
+        if status == 202 and not monitor_url:
+            # Accepted but untrackable: the copy may still fail, so never delete on trust.
+            reason = "copy accepted without a monitor URL"
+            print(f"⚠️ Archive/Cleanup failed for '{row.file_name}': {reason}; original kept")
+            self._archive_failed(row, error=reason)
+            return
+
+        def confirmed():
+            self.metrics.add(row, copy_confirm_sec=time.monotonic() - tracked)
+            self._delete(drive_id, row)
+
+        def failed(reason):
+            print(f"⚠️ Archive/Cleanup failed for '{row.file_name}': {reason}; original kept")
+            self._archive_failed(row, copy_confirm_sec=time.monotonic() - tracked, error=reason)
+
+        self.copy_monitor.track(monitor_url if status == 202 else None, confirmed, failed)
+
+    def _delete(self, drive_id: str, row):
+        if self.batch_archive:
+            with self._delete_lock:
+                self._delete_queue.append(row)
+                if len(self._delete_queue) < self.sp.BATCH_LIMIT:
+                    return
+                ready, self._delete_queue = self._delete_queue, []
+            self._delete_batch(drive_id, ready)
             return
+        started = time.monotonic()
+        self.sp.transport.thread_stats(reset=True)
+        try:
+            self.sp.delete_original(drive_id, row.folder_name, row.file_name)
+            print(f"🧹 Deleted original: {row.file_name}")
+            self.metrics.add(row, delete_sec=time.monotonic() - started, archive_outcome="deleted",
+                             **self._request_counts())
+            if self.journal is not None:
+                self.journal.mark(row, "deleted")
+        except Exception as e:
+            print(f"⚠️ Archive/Cleanup failed for '{row.file_name}': {e}")
+            self._archive_failed(row, delete_sec=time.monotonic() - started, error=str(e)[:1000],
+                                 **self._request_counts())
 
-        display(df_files)  # keep your preview
+    def _flush_deletes(self, drive_id: str):
+        with self._delete_lock:
+            ready, self._delete_queue = self._delete_queue, []
+        if ready:
+            self._delete_batch(drive_id, ready)
 
-        for _, row in df_files.iterrows():
-            original_file_name = row["file_name"]
-            safe_name = original_file_name.replace("'", "_")
-            folder_name = row["folder_name"]
-            file_url = row["file_url"]
-            lakehouse_folder = row["lakehouse_folder"]
+    def _delete_batch(self, drive_id: str, rows: list):
+        jobs = [{"folder_name": r.folder_name, "file_name": r.file_name} for r in rows]
+        started = time.monotonic()
+        try:
+            delete_results = self.sp.delete_originals_many(drive_id, jobs)
+        except Exception as e:
+            print(f"⚠️ Delete batch of {len(jobs)} file(s) failed: {e}")
+            for row in rows:
+                self._archive_failed(row, error=str(e)[:1000])
+            return
+        elapsed = time.monotonic() - started  # batch duration, attributed to each file in it
+        for row, job, (ok, result) in zip(rows, jobs, delete_results):
+            if ok:
+                print(f"🧹 Deleted original: {job['file_name']}")
+                self.metrics.add(row, delete_sec=elapsed, archive_outcome="deleted")
+                if self.journal is not None:
+                    self.journal.mark(row, "deleted")
+            else:
+                error = f"Failed to delete original file. {self.sp._batch_error(result)}"
+                print(f"⚠️ Archive/Cleanup failed for '{job['file_name']}': {error}")
+                self._archive_failed(row, delete_sec=elapsed, error=error)
 
+    def _archive_batch(self, drive_id: str, rows: list):
+        # Same steps as _archive, but copies (and later deletes) go out as Graph $batch calls of up to 20.
+        jobs, started = [], time.monotonic()
+        for row in rows:
+            archive_folder_path = f"{row.folder_name}/archive"
             try:
-                local_path = self.lakehouse.download_to_local(file_url, safe_name)
-                lakehouse_path = self.lakehouse.upload(local_path, lakehouse_folder, safe_name)
-                print(f"✅ Uploaded to Lakehouse: {lakehouse_path}")
+                self.sp.ensure_archive_folder(drive_id, archive_folder_path)
             except Exception as e:
-                print(f"⚠️ Skipped '{original_file_name}' due to error: {e}")
+                print(f"⚠️ Archive/Cleanup failed for '{row.file_name}': {e}")
+                self._archive_failed(row, error=str(e)[:1000])
+                continue
+            jobs.append({"row": row, "folder_name": row.folder_name, "file_name": row.file_name,
+                         "archive_folder_path": archive_folder_path,
+                         "archive_file_name": self._timestamped(row.file_name.replace("'", "_"))})
+        if not jobs:
+            return
+
+        try:
+            copy_results = self.sp.copy_to_archive_many(drive_id, jobs)
+        except Exception as e:
+            print(f"⚠️ Archive batch of {len(jobs)} file(s) failed: {e}")
+            for job in jobs:
+                self._archive_failed(job["row"], error=str(e)[:1000])
+            return
+        elapsed = time.monotonic() - started  # batch duration, attributed to each file in it
+        for job, (ok, result) in zip(jobs, copy_results):
+            if not ok:
+                error = f"Failed to copy to archive. {self.sp._batch_error(result)}"
+                print(f"⚠️ Archive/Cleanup failed for '{job['file_name']}': {error}")
+                self._archive_failed(job["row"], archive_sec=elapsed, error=error)
                 continue
+            print(f"📦 Copy to archive started: /{job['archive_folder_path']}/{job['archive_file_name']}")
+            self.metrics.add(job["row"], archive_sec=elapsed, archive_outcome="copied")
+            if self.journal is not None:
+                self.journal.mark(job["row"], "archived", archive_file_name=job["archive_file_name"])
+            self._after_copy(drive_id, job["row"], result.get("status"), self.sp.batch_header(result, "Location"))
+
+    def _resume_delete(self, drive_id: str, row, rec: dict) -> bool:
+        """Deletes the original of a file archived by an interrupted run, once its archive copy is found.
+
+        Returns False when the copy is missing, so the caller archives the file again.
+        """
+        if not row.delete_original:
+            return True
+        try:
+            self.sp.get_item(drive_id, f"{row.folder_name}/archive/{rec.get('archive_file_name')}")
+        except Exception:
+            print(f"🔁 Archive copy of '{row.file_name}' not found; archiving again")
+            return False
+        self._delete(drive_id, row)
+        return True
+
+    def _finished(self, rec: dict) -> bool:
+        # Whether a journal record needs nothing more from a later run.
+        state = rec.get("state")
+        if state == "discovered":
+            return True  # nothing landed yet; the next listing starts it over
+        if self.loader is not None and not rec.get("loaded"):
+            return False
+        target = "landed"
+        if rec.get("copy_to_archive"):
+            target = "deleted" if rec.get("delete_original") else "archived"
+        return RunJournal.STATES.index(state) >= RunJournal.STATES.index(target)
+
+    def _submit(self, pool: ThreadPoolExecutor, row):
+        if self.site_slots is None:
+            return pool.submit(self._transfer, row)
+        self.site_slots.acquire()
+        try:
+            future = pool.submit(self._transfer, row)
+        except Exception:
+            self.site_slots.release()
+            raise
+        future.add_done_callback(lambda _: self.site_slots.release())
+        return future
+
+    def _timed(self, files):
+        # Streams discovery results while charging the time spent listing to the discover phase.
+        iterator = iter(files)
+        while True:
+            started = time.monotonic()
+            try:
+                row = next(iterator)
+            except StopIteration:
+                self.metrics.add_run_phase("discover_sec", time.monotonic() - started)
+                return
+            self.metrics.add_run_phase("discover_sec", time.monotonic() - started)
+            yield row
+
+    def run(self, source_folder_list: list, executor: ThreadPoolExecutor = None):
+        if self._owns_metrics:
+            self.metrics = RunMetrics(tz=self.tz, transport=self.sp.transport)
+        drive_label = f" (drive: {self.discovery.drive_name})" if self.discovery.drive_name else ""
+        print(f"Processing files from SharePoint Site: {self.discovery.site_path}{drive_label}")
+
+        site_id = self.sp.get_site_id()
+        drive_id = self.sp.get_document_drive_id(site_id, self.discovery.drive_name)
+        self.sp.reset_folder_cache()
+        if self.journal is not None:
+            self.journal.load()
+
+        discovered = self._timed(self.discovery.iter_files(drive_id, source_folder_list))
+        if self.preview:
+            # Preview needs the full listing up front, so transfers wait for discovery to finish.
+            discovered = list(discovered)
+            if discovered:
+                display(self.discovery.to_dataframe(discovered))
+
+        failed_folders = set()
+        landed = {}  # lakehouse_folder -> [(row, lakehouse_path), ...] still to load
+        landed_rows = []  # every file landed (or resumed) this run, in discovery order
+        load_failed = set()  # lakehouse_folders whose Delta load failed
+        self._cleanup_failed = set()
+        archive_queue = []  # rows waiting for a batched archive call
+        pending = deque()  # (row, future, journal record) in discovery order
+        discovered_count, discovery_error = 0, None
+
+        def start(row):
+            # Files an interrupted run already landed skip the transfer and pick up where it stopped.
+            rec = self.journal.resume_point(row) if self.journal is not None else None
+            if rec is None:
+                if self.journal is not None:
+                    self.journal.mark(row, "discovered")
+                return row, self._submit(pool, row), None
+            future = Future()
+            future.set_result(rec["lakehouse_path"])
+            self.metrics.add(row, outcome="landed", transfer_mode="resumed")
+            return row, future, rec
+
+        def handle(row, future, rec):
+            nonlocal archive_queue
+            try:
+                lakehouse_path = future.result()
+                if rec is None:
+                    print(f"✅ Uploaded to Lakehouse: {lakehouse_path}")
+                    if self.journal is not None:
+                        self.journal.mark(row, "landed", lakehouse_path=lakehouse_path)
+                else:
+                    print(f"🔁 Already in Lakehouse (resumed, {rec['state']}): {lakehouse_path}")
+                if not (rec and rec.get("loaded")):
+                    landed.setdefault(row.lakehouse_folder, []).append((row, lakehouse_path))
+                landed_rows.append(row)
+            except Exception as e:
+                print(f"⚠️ Skipped '{row.file_name}' due to error: {e}")
+                failed_folders.add(row.source_folder)
+                return
 
             # archive + optional delete
-            if str(row.get("copy_to_archive", "False")).lower() == "true":
-                archive_folder_path = f"{folder_name}/archive"
+            if rec and rec.get("state") in ("archived", "deleted"):
+                if rec["state"] == "deleted" or self._resume_delete(drive_id, row, rec):
+                    return
+            if row.copy_to_archive:
+                if not self.batch_archive:
+                    self._archive(drive_id, row)
+                    return
+                archive_queue.append(row)
+                if len(archive_queue) >= self.sp.BATCH_LIMIT:
+                    self._archive_batch(drive_id, archive_queue)
+                    archive_queue = []
+
+        # Transfers start as soon as each file is discovered and run concurrently; results are
+        # handled in discovery order so archive/delete keep the same per-folder ordering.
+        own_pool = executor is None
+        pool = executor or ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sp-transfer")
+        try:
+            try:
+                for row in discovered:
+                    discovered_count += 1
+                    pending.append(start(row))
+                    while pending and pending[0][1].done():
+                        handle(*pending.popleft())
+            except Exception as e:
+                discovery_error = e
+                print(f"⚠️ Discovery failed; finishing {len(pending)} file(s) already queued: {e}")
+            while pending:
+                handle(*pending.popleft())
+        finally:
+            if own_pool:
+                pool.shutdown(wait=True)
+
+        if self.journal is not None and self.loader is not None and discovery_error is None:
+            # Landed by an interrupted run and since archived away or deleted, but never loaded.
+            for rec in self.journal.stranded():
+                landed.setdefault(rec.get("lakehouse_folder"), []).append((DiscoveredFile(**rec), rec["lakehouse_path"]))
+
+        if not discovered_count and not landed and discovery_error is None:
+            self.discovery.commit_delta_links()
+            if self.journal is not None:
+                self.journal.compact(self._finished)
+            print("No files found. Process completed.")
+            if self._owns_metrics:
+                self.metrics.print_summary()
+            return
+
+        if archive_queue:
+            self._archive_batch(drive_id, archive_queue)
+        self.copy_monitor.wait()
+        self._flush_deletes(drive_id)
+        if self.journal is not None:
+            self.journal.flush()
+
+        if self.loader is not None:
+            for lakehouse_folder, files in landed.items():
+                started = time.monotonic()
                 try:
-                    self.sp.ensure_archive_folder(drive_id, archive_folder_path)
-                    archive_file_name = self._timestamped(safe_name)
-                    self.sp.copy_to_archive(drive_id, folder_name, original_file_name, archive_folder_path, archive_file_name)
-                    print(f"📦 Copied to archive: /{archive_folder_path}/{archive_file_name}")
-                    if str(row.get("delete_original", "False")).lower() == "true":
-                        self.sp.delete_original(drive_id, folder_name, original_file_name)
-                        print(f"🧹 Deleted original: {original_file_name}")
+                    self.loader.load(lakehouse_folder, [path for _, path in files])
+                    if self.journal is not None:
+                        for row, _ in files:
+                            self.journal.mark(row, loaded=True)
                 except Exception as e:
-                    print(f"⚠️ Archive/Cleanup failed for '{original_file_name}': {e}")
+                    load_failed.add(lakehouse_folder)
+                    print(f"⚠️ Delta load failed for '{lakehouse_folder}' ({len(files)} file(s) remain in /Files): {e}")
+                self.metrics.add_run_phase("delta_load_sec", time.monotonic() - started)
+
+        if self.manifest is not None:
+            # Only files that landed, loaded and were archived/deleted count as ingested; the rest
+            # stay out of the manifest so the next run picks them up again.
+            for row in landed_rows:
+                if row.lakehouse_folder not in load_failed and RunMetrics._key(row) not in self._cleanup_failed:
+                    self.manifest.record(row)
+            try:
+                self.manifest.flush()
+            except Exception as e:
+                print(f"⚠️ Failed to update ingestion manifest; files will be re-ingested next run: {e}")
+
+        # A folder's delta token only advances when all its files were also loaded and archived;
+        # otherwise incremental runs would never see the unfinished files again.
+        for lakehouse_folder in load_failed:
+            failed_folders.update(row.source_folder for row, _ in landed[lakehouse_folder])
+        failed_folders.update(row.source_folder for row in landed_rows if RunMetrics._key(row) in self._cleanup_failed)
+        if discovery_error is None:
+            self.discovery.commit_delta_links(skip_folders=failed_folders)
+        if self.journal is not None:
+            if discovery_error is None:
+                self.journal.compact(self._finished)
+            else:
+                self.journal.flush()
+        if self._owns_metrics:
+            self.metrics.print_summary()
+        if discovery_error is not None:
+            raise discovery_error
 
 
 # ---- Backwards-compatible thin facade ----
@@ -252,27 +2117,128 @@ class TransferFromSharepoint:
         # print(config.get("sharepoint", {}))
 
         sp_cfg = self.config.get("sharepoint", {})
-        hostname = sp_cfg.get("hostname")
-        site_path = sp_cfg.get("site_path")
-        
-        if not all([hostname, site_path]):
-            raise ValueError("Missing SharePoint configuration in config.json")
-
-        token = AzureAuthenticator(tenant_id, client_id, client_secret).get_access_token()
-        self.sp = SharePointService(token, hostname, site_path)
-        self.discovery = FileDiscovery(self.sp, site_path, tz="Asia/Kuala_Lumpur")
+        # "sites" lists several site/drive sources; without it the single hostname/site_path is used.
+        self.sources = sp_cfg.get("sites") or [{
+            "hostname": sp_cfg.get("hostname"),
+            "site_path": sp_cfg.get("site_path"),
+            "drive_name": sp_cfg.get("drive_name"),
+            "source_folder_list": sp_cfg.get("source_folder_list", []),
+        }]
+        for source in self.sources:
+            if not all([source.get("hostname"), source.get("site_path")]):
+                raise ValueError("Missing SharePoint configuration in config.json")
+
         lakehouse_root = self.config["bronze"]["lakehouse_root"]
-        self.lakehouse = LakehouseService(lakehouse_root)
-        self.orchestrator = SharePointToLakehouseOrchestrator(self.sp, self.discovery, self.lakehouse, tz="Asia/Kuala_Lumpur")
+        ingestion = self.config.get("ingestion", {})
+        self.state_store = LakehouseStateStore(lakehouse_root)
+        cache_store = self.state_store if str(azure_auth.get("persist_token_cache", "False")).lower() == "true" else None
+        authenticator = AzureAuthenticator(tenant_id, client_id, client_secret, cache_store=cache_store)
+        self.token_provider = TokenProvider(authenticator)
+        self.token_provider.get_token()  # fail fast on bad credentials
+        self.max_workers = int(ingestion.get("max_workers", 8))
+        self.max_parallel_sources = int(ingestion.get("max_parallel_sources", 4))
+        max_workers_per_site = int(ingestion.get("max_workers_per_site", self.max_workers))
+        range_parallelism = max(1, int(ingestion.get("ranged_download_parallelism", 4)))
+        parallel_sources = min(len(self.sources), self.max_parallel_sources)
+        self.transport = HttpTransport(
+            # every transfer worker may fetch ranges in parallel; each running source also has its
+            # own discovery and copy-monitor pools, so keep-alive survives a full fan-out
+            pool_size=self.max_workers * range_parallelism + 2 * self.max_workers * parallel_sources,
+            max_retries=int(ingestion.get("max_retries", 5)),
+            max_requests_per_sec=float(ingestion.get("max_requests_per_sec", 0)),
+        )
+        self.manifest = None
+        if str(ingestion.get("skip_unchanged", "False")).lower() == "true":
+            manifest_table = ingestion.get("manifest_table", "Tables/dbo/_ingest_manifest")
+            self.manifest = IngestManifest(self.spark, f"{lakehouse_root}/{manifest_table.lstrip('/')}", tz="Asia/Kuala_Lumpur")
+        self.lakehouse = LakehouseService(
+            lakehouse_root,
+            streaming=str(ingestion.get("streaming_upload", "True")).lower() == "true",
+            chunk_size=int(ingestion.get("stream_chunk_mb", 8)) * 1024 * 1024,
+            range_threshold=int(ingestion.get("ranged_download_threshold_mb", 256)) * 1024 * 1024,
+            range_parallelism=range_parallelism,
+            transport=self.transport,
+        )
+        self.loader = None
+        if str(ingestion.get("load_to_delta", "True")).lower() == "true":
+            self.loader = BronzeDeltaLoader(self.spark, lakehouse_root, self.config.get("bronze", {}), tz="Asia/Kuala_Lumpur")
+        batch_archive = str(ingestion.get("batch_archive", "False")).lower() == "true"
+        metrics_table = ingestion.get("metrics_table")
+        self.metrics_table = f"{lakehouse_root}/{metrics_table.lstrip('/')}" if metrics_table else None
+        self.metrics = RunMetrics(tz="Asia/Kuala_Lumpur", transport=self.transport)
+        id_cache_ttl_hours = float(ingestion.get("id_cache_ttl_hours", 24))
+        self.resolution_cache = ResolutionCache(self.state_store, ttl_sec=int(id_cache_ttl_hours * 3600)) if id_cache_ttl_hours > 0 else None
+
+        resume_runs = str(ingestion.get("resume_journal", "False")).lower() == "true"
+
+        # One SharePointService (and its site/drive id cache) and one fairness semaphore per site.
+        services, slots = {}, {}
+        self.orchestrators = []
+        for source in self.sources:
+            site_key = (source["hostname"], source["site_path"])
+            if site_key not in services:
+                services[site_key] = SharePointService(self.token_provider, *site_key, transport=self.transport,
+                                                       resolution_cache=self.resolution_cache)
+                slots[site_key] = threading.Semaphore(max_workers_per_site)
+            discovery = FileDiscovery(services[site_key], source["site_path"], tz="Asia/Kuala_Lumpur",
+                                      state_store=self.state_store, manifest=self.manifest,
+                                      max_workers=self.max_workers, drive_name=source.get("drive_name"))
+            self.orchestrators.append(SharePointToLakehouseOrchestrator(
+                services[site_key], discovery, self.lakehouse, tz="Asia/Kuala_Lumpur",
+                max_workers=self.max_workers, loader=self.loader, manifest=self.manifest,
+                batch_archive=batch_archive, site_slots=slots[site_key] if len(self.sources) > 1 else None,
+                metrics=self.metrics, preview=str(ingestion.get("preview", "False")).lower() == "true",
+                journal=RunJournal(self.state_store, f"{source['site_path']}_{source.get('drive_name') or 'default'}")
+                if resume_runs else None))
+
+        # kept for callers that used the single-site attributes
+        self.orchestrator = self.orchestrators[0]
+        self.sp = self.orchestrator.sp
+        self.discovery = self.orchestrator.discovery
 
     def process_files(self):
-        source_folder_list = self.config.get("sharepoint", {}).get("source_folder_list", [])
-        self.orchestrator.run(source_folder_list)
+        self.metrics = RunMetrics(tz="Asia/Kuala_Lumpur", transport=self.transport)
+        for orch in self.orchestrators:
+            orch.metrics = self.metrics
+        try:
+            self._run_sources()
+        finally:
+            self.metrics.print_summary()
+            if self.metrics_table:
+                try:
+                    written = self.metrics.write(self.spark, self.metrics_table)
+                    print(f"📊 Appended {written} metric record(s) to {self.metrics_table}")
+                except Exception as e:
+                    print(f"⚠️ Failed to write run metrics: {e}")
+
+    def _run_sources(self):
+        if len(self.orchestrators) == 1:
+            self.orchestrator.run(self.sources[0].get("source_folder_list", []))
+            return
+
+        # All sources share one transfer pool (the global concurrency budget); each site's
+        # semaphore keeps a large site from monopolising it.
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="sp-transfer") as transfer_pool, \
+                ThreadPoolExecutor(max_workers=min(len(self.orchestrators), self.max_parallel_sources),
+                                   thread_name_prefix="sp-source") as source_pool:
+            futures = [source_pool.submit(orch.run, source.get("source_folder_list", []), transfer_pool)
+                       for source, orch in zip(self.sources, self.orchestrators)]
+            failures = []
+            for source, future in zip(self.sources, futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"⚠️ Source '{source['site_path']}' failed: {e}")
+                    failures.append(source["site_path"])
+        # Other sources still run to completion, but the run must not report success.
+        if failures:
+            raise RuntimeError(f"{len(failures)} of {len(self.sources)} source(s) failed: {', '.join(failures)}")
 
 
 # In[16]:
 
 
-processor = TransferFromSharepoint(config, spark)
-processor.process_files()
+if __name__ == "__main__":  # true in a Fabric notebook; lets the benchmark harness import this module
+    processor = TransferFromSharepoint(config, spark)
+    processor.process_files()
 
@@ -123,61 +123,195 @@ else:
 # In[5]:
 
 
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
 import pandas as pd
 from IPython.display import display, HTML
 
-# Step 1: Retrieve the list of SharePoint sites
-print("Retrieving list of SharePoint sites...")
-graph_api_url = "https://graph.microsoft.com/v1.0/sites?search=*"
-
-headers = {
-    "Authorization": f"Bearer {access_token}",
-    "Accept": "application/json"
-}
-
-response = requests.get(graph_api_url, headers=headers)
-if response.status_code == 200:
-    sites_data = response.json().get('value', [])
-    print(f"Retrieved {len(sites_data)} sites.")
-else:
-    print(f"Failed to retrieve sites. Status Code: {response.status_code}")
-    print(response.json())
-
-# Step 2: Put the data in a DataFrame
-df = pd.DataFrame(sites_data)
-df_display = df[['name', 'lastModifiedDateTime', 'webUrl']]
-
-# Step 3: Check which sites are accessible for the 2nd AppReg and add a new column "accessible"
-df['accessible'] = 'No'  # Initialize the column with 'No'
-app_id_to_check = "aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa"  # Replace with your 2nd App Registration client ID (Site Access App)
-
-for index, site in df.iterrows():
-    site_id = site['id']
-    permissions_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/permissions"
-    
-    response = requests.get(permissions_url, headers=headers)
-    if response.status_code == 200:
-        permissions_data = response.json().get('value', [])
-        for permission in permissions_data:
-            if 'grantedToIdentitiesV2' in permission:
-                for grantee in permission['grantedToIdentitiesV2']:
-                    if grantee['application'].get('id') == app_id_to_check:
-                        df.at[index, 'accessible'] = 'Yes'
-                        print(permissions_data)
-                        break
-
-# Step 4: Create a new DataFrame for display with specific columns
-df_display = df[['name', 'lastModifiedDateTime', 'webUrl', 'accessible']]
-
-# Step 5: Define the highlight function
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+session = requests.Session()  # reuses connections across the many calls below
+
+
+def graph_request(method, url, max_retries=5, idempotent=None, **kwargs):
+    """Calls Graph, waiting out throttling (429/503, honouring Retry-After) and transient 5xx errors.
+
+    POSTs are only retried on 429/503 (not processed), unless marked idempotent: a retried
+    grant after a 5xx could add the same permission twice.
+    """
+    headers = {"Authorization": f"Bearer {access_token}", "Accept": "application/json"}
+    if idempotent is None:
+        idempotent = method.upper() != "POST"
+    retry_statuses = (429, 500, 502, 503, 504) if idempotent else (429, 503)
+    for attempt in range(max_retries + 1):
+        response = session.request(method, url, headers=headers, timeout=120, **kwargs)
+        if response.status_code not in retry_statuses or attempt == max_retries:
+            return response
+        retry_after = response.headers.get("Retry-After")
+        wait = float(retry_after) if retry_after and retry_after.isdigit() else min(60, 2 ** attempt)
+        time.sleep(wait + random.uniform(0, 0.5))
+    return response
+
+
+def list_all_sites(search="*"):
+    """Returns every site matching the search, following @odata.nextLink across pages."""
+    sites, url = [], f"{GRAPH_URL}/sites?search={search}"
+    while url:
+        response = graph_request("GET", url)
+        if response.status_code != 200:
+            raise RuntimeError(f"Failed to retrieve sites. Status Code: {response.status_code} | {response.text}")
+        body = response.json()
+        sites.extend(body.get("value", []))
+        url = body.get("@odata.nextLink")
+    return sites
+
+
+def fetch_permissions_batch(site_ids, max_retries=5):
+    """Fetches /sites/{id}/permissions for up to 20 sites in one $batch call; throttled ones are resent.
+
+    Returns (permissions, errors): permissions by site ID for the sites that could be read, and
+    the failure ("Status Code: ...") by site ID for the ones that could not.
+    """
+    results, errors, todo = {}, {}, list(site_ids)
+    for attempt in range(max_retries + 1):
+        payload = {"requests": [{"id": str(i), "method": "GET", "url": f"/sites/{site_id}/permissions"}
+                                for i, site_id in enumerate(todo)]}
+        response = graph_request("POST", f"{GRAPH_URL}/$batch", json=payload, idempotent=True)  # GETs only
+        if response.status_code != 200:
+            raise RuntimeError(f"Permissions batch failed. Status Code: {response.status_code} | {response.text}")
+        throttled, wait = [], 0
+        for sub in response.json().get("responses", []):
+            site_id = todo[int(sub["id"])]
+            if sub.get("status") in (429, 503) and attempt < max_retries:
+                throttled.append(site_id)
+                retry_after = (sub.get("headers") or {}).get("Retry-After", "")
+                wait = max(wait, float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+            elif sub.get("status") == 200:
+                body = sub.get("body") or {}
+                permissions = body.get("value", [])
+                next_link = body.get("@odata.nextLink")
+                while next_link:
+                    page_response = graph_request("GET", next_link)
+                    if page_response.status_code != 200:
+                        raise RuntimeError(f"Failed to retrieve permissions for site {site_id}. "
+                                           f"Status Code: {page_response.status_code} | {page_response.text}")
+                    page = page_response.json()
+                    permissions.extend(page.get("value", []))
+                    next_link = page.get("@odata.nextLink")
+                results[site_id] = permissions
+            else:
+                # 403, 5xx, or still throttled after the last retry: unknown, not "no access"
+                message = ((sub.get("body") or {}).get("error") or {}).get("message", "")
+                errors[site_id] = f"Status Code: {sub.get('status')} | {message}"
+        if not throttled:
+            break
+        time.sleep(wait + random.uniform(0, 0.5))
+        todo = throttled
+    return results, errors
+
+
+def app_roles(permissions, app_id):
+    """Roles granted to app_id in a site's permissions, or None if the app has no grant there."""
+    for permission in permissions or []:
+        for grantee in permission.get("grantedToIdentitiesV2", []) or permission.get("grantedToIdentities", []):
+            if (grantee.get("application") or {}).get("id") == app_id:
+                return permission.get("roles", [])
+    return None
+
+
+def grant_site_permission(site_id, app_id, role, display_name):
+    payload = {"roles": [role], "grantedToIdentities": [{"application": {"id": app_id, "displayName": display_name}}]}
+    response = graph_request("POST", f"{GRAPH_URL}/sites/{site_id}/permissions", json=payload)
+    return response.status_code == 201, response
+
+
+def audit_site_permissions(app_ids, site_urls=None, grant_role=None, max_workers=8):
+    """Checks which sites each app in app_ids can access, optionally granting grant_role where missing.
+
+    - app_ids: client IDs of the App Registrations to check
+    - site_urls: webUrls (or site names) to limit the audit to; None audits every site in the tenant
+    - grant_role: e.g. "read" or "write"; grants it to every app missing on the selected sites.
+      Requires site_urls, so a typo can't grant access across the whole tenant.
+
+    Permissions are read with Graph $batch (20 sites per call), several batches at a time.
+    Returns one row per site with a column per app ID holding its roles ("" = no access).
+    Sites whose permissions could not be read show "(error)", are never granted to, and are listed
+    with their error so they can be checked by hand.
+    """
+    if grant_role and not site_urls:
+        raise ValueError("grant_role needs an explicit site_urls list")
+
+    print("Retrieving list of SharePoint sites...")
+    sites = list_all_sites()
+    print(f"Retrieved {len(sites)} sites.")
+    if site_urls:
+        wanted = {u.rstrip("/").lower() for u in site_urls}
+        sites = [s for s in sites if (s.get("webUrl") or "").rstrip("/").lower() in wanted
+                 or (s.get("name") or "").lower() in wanted]
+        print(f"Auditing {len(sites)} of {len(site_urls)} requested sites.")
+
+    site_ids = [s["id"] for s in sites]
+    chunks = [site_ids[i:i + 20] for i in range(0, len(site_ids), 20)]
+    permissions, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for result, failed in pool.map(fetch_permissions_batch, chunks):
+            permissions.update(result)
+            errors.update(failed)
+    for site in sites:
+        if site["id"] in errors:
+            print(f"Could not read permissions of {site.get('webUrl')}. {errors[site['id']]}")
+
+    grants = []
+    for site in sites:
+        if site["id"] in errors:
+            continue  # unknown permissions: granting could duplicate an existing grant
+        for app_id in app_ids:
+            if grant_role and app_roles(permissions.get(site["id"]), app_id) is None:
+                grants.append((site, app_id))
+    if grants:
+        print(f"Granting '{grant_role}' for {len(grants)} site/app pair(s)...")
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            outcomes = pool.map(lambda g: grant_site_permission(g[0]["id"], g[1], grant_role, g[0].get("displayName") or g[0].get("name")), grants)
+            for (site, app_id), (ok, response) in zip(grants, outcomes):
+                if ok:
+                    permissions.setdefault(site["id"], []).append(response.json())
+                    print(f"Granted {grant_role} to {app_id} on {site.get('webUrl')}")
+                else:
+                    print(f"Failed to grant {app_id} on {site.get('webUrl')}. Status Code: {response.status_code}")
+                    print(response.text)
+
+    rows = []
+    for site in sites:
+        row = {"name": site.get("name"), "lastModifiedDateTime": site.get("lastModifiedDateTime"), "webUrl": site.get("webUrl")}
+        if site["id"] in errors:
+            row.update({app_id: "(error)" for app_id in app_ids})
+            row["accessible"] = "Unknown"
+            rows.append(row)
+            continue
+        for app_id in app_ids:
+            roles = app_roles(permissions.get(site["id"]), app_id)
+            row[app_id] = ", ".join(roles) if roles else ("(no roles)" if roles == [] else "")
+        row["accessible"] = "Yes" if any(row[app_id] for app_id in app_ids) else "No"
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["name", "lastModifiedDateTime", "webUrl", *app_ids, "accessible"])
+
+
+# Check which SharePoint sites are accessible for the 2nd AppReg
+app_ids_to_check = ["aaaaaaaa-aaaa-aaaa-aaaa-aaaaaaaaaaaa"]  # Replace with your App Registration client IDs (Site Access Apps)
+df_display = audit_site_permissions(app_ids_to_check)
+
+# To grant and verify in one pass, limit the run to specific sites:
+# df_display = audit_site_permissions(app_ids_to_check, site_urls=["https://yourcompany.sharepoint.com/sites/YourSiteName"], grant_role="write")
+
+# Define the highlight function
 def highlight_accessible(s):
     if s['accessible'] == 'Yes':
         return ['background-color: yellow; font-weight: bold'] * len(s)
     else:
         return [''] * len(s)
 
-# Step 6: Display the sites in a tabular format with grid and highlight accessible sites
+# Display the sites in a tabular format with grid and highlight accessible sites
 styled_df = df_display.style.apply(highlight_accessible, axis=1)
 display(HTML(styled_df.to_html()))
-